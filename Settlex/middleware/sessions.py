@@ -0,0 +1,80 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache, caches
+from django.utils.http import http_date
+
+
+def session_refresh_cache_key(session_key):
+    """Present while a throttled view's expiry refresh of the session is still fresh."""
+    return f"session_refreshed:{session_key}"
+
+
+def touch_session(session):
+    """
+    Push a stored session's expiry forward without rewriting its data, so a
+    request that held its session snapshot for a long time (a parked chat
+    poll) cannot overwrite what other requests saved meanwhile.
+    """
+    if isinstance(session, DBStore):
+        session.model.objects.filter(session_key=session.session_key).update(
+            expire_date=session.get_expiry_date())
+    if hasattr(session, "cache_key"):
+        # cache and cached_db engines
+        caches[settings.SESSION_CACHE_ALIAS].touch(session.cache_key, session.get_expiry_age())
+
+
+class ThrottledSessionMiddleware(SessionMiddleware):
+    """
+    SessionMiddleware with a rolling expiry that is cheap for polling endpoints.
+
+    Replaces ``SESSION_SAVE_EVERY_REQUEST``: ordinary requests still save the
+    session (pushing its expiry forward) every time. Views named in
+    ``SESSION_REFRESH_THROTTLED_VIEWS`` save it only when they modified it;
+    otherwise they move just its expiry (see touch_session), at most once
+    every ``SESSION_REFRESH_INTERVAL`` seconds, so idle tabs polling the chat
+    neither write the session on every request nor clobber newer session data.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.throttled_views = frozenset(settings.SESSION_REFRESH_THROTTLED_VIEWS)
+        self.refresh_interval = settings.SESSION_REFRESH_INTERVAL
+
+    def _is_throttled(self, request):
+        match = getattr(request, "resolver_match", None)
+        return match is not None and match.view_name in self.throttled_views
+
+    def _refresh_due(self, session):
+        return cache.add(session_refresh_cache_key(session.session_key), True, self.refresh_interval)
+
+    def _set_cookie(self, session, response):
+        # As SessionMiddleware does after a save, so the browser's cookie expiry moves too
+        if session.get_expire_at_browser_close():
+            max_age = expires = None
+        else:
+            max_age = session.get_expiry_age()
+            expires = http_date(time.time() + max_age)
+        response.set_cookie(
+            settings.SESSION_COOKIE_NAME,
+            session.session_key,
+            max_age=max_age,
+            expires=expires,
+            domain=settings.SESSION_COOKIE_DOMAIN,
+            path=settings.SESSION_COOKIE_PATH,
+            secure=settings.SESSION_COOKIE_SECURE or None,
+            httponly=settings.SESSION_COOKIE_HTTPONLY or None,
+            samesite=settings.SESSION_COOKIE_SAMESITE,
+        )
+
+    def process_response(self, request, response):
+        session = getattr(request, "session", None)
+        if session is not None and session.session_key and not session.modified:
+            if not self._is_throttled(request):
+                session.modified = True
+            elif response.status_code < 500 and not session.is_empty() and self._refresh_due(session):
+                touch_session(session)
+                self._set_cookie(session, response)
+        return super().process_response(request, response)
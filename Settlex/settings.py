@@ -24,6 +24,7 @@ CSRF_TRUSTED_ORIGINS = [
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
 INSTALLED_APPS = [
+    'daphne',  # ASGI runserver for the WebSocket chat transport
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -31,6 +32,7 @@ INSTALLED_APPS = [
     'django_extensions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'channels',
     'settlements_app.apps.SettlementsAppConfig',
     'corsheaders',  # Fix Cross-Origin Requests
     'django_otp',
@@ -42,7 +44,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'Settlex.middleware.sessions.ThrottledSessionMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django_otp.middleware.OTPMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -84,13 +86,62 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'Settlex.wsgi.application'
+ASGI_APPLICATION = 'Settlex.asgi.application'
+
+# Database profile: SQLite by default, PostgreSQL when DB_ENGINE=postgresql
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+SQLITE_DATABASE = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': os.environ.get("SQLITE_PATH", BASE_DIR / 'db.sqlite3'),
+    'OPTIONS': {
+        # WAL lets readers run alongside the single writer; NORMAL sync is safe under WAL.
+        # Run `manage.py sqlite_maintenance` periodically to optimize and checkpoint.
+        'init_command': (
+            "PRAGMA journal_mode=WAL;"
+            "PRAGMA synchronous=NORMAL;"
+            "PRAGMA busy_timeout=20000;"
+            "PRAGMA mmap_size=268435456;"  # 256 MB
+            "PRAGMA cache_size=-65536;"  # 64 MB
+        ),
+        # Take the write lock up front so lock upgrades cannot fail with "database is locked"
+        'transaction_mode': 'IMMEDIATE',
+    },
+}
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+if DB_ENGINE == "postgresql":
+    DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", "0"))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get("POSTGRES_DB", "settlex"),
+            'USER': os.environ.get("POSTGRES_USER", "settlex"),
+            'PASSWORD': os.environ.get("POSTGRES_PASSWORD", ""),
+            'HOST': os.environ.get("POSTGRES_HOST", "localhost"),
+            'PORT': os.environ.get("POSTGRES_PORT", "5432"),
+            # Persistent connections, checked before reuse; the pool replaces them when enabled
+            'CONN_MAX_AGE': 0 if DB_POOL_MAX_SIZE else int(os.environ.get("DB_CONN_MAX_AGE", "60")),
+            'CONN_HEALTH_CHECKS': True,
+            # Server-side cursors do not survive pgbouncer transaction pooling
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get("DB_PGBOUNCER", "") == "1",
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+    if DB_POOL_MAX_SIZE:
+        # In-process psycopg 3 pool (per worker); leave unset behind pgbouncer
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': 10,
+        }
+    # Source alias for `manage.py migrate_sqlite_to_postgres`
+    if os.environ.get("SQLITE_PATH"):
+        DATABASES['sqlite'] = SQLITE_DATABASE
+else:
+    DATABASES = {
+        'default': SQLITE_DATABASE,
     }
-}
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -110,7 +161,30 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 # During deployment: where collectstatic puts the final compiled static files
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# In-process worker pool for post-commit background work (settlements_app.tasks);
+# eager mode runs tasks inline at commit, for tests
+BACKGROUND_TASK_WORKERS = 4
+BACKGROUND_TASKS_EAGER = False
+
+# Per-request upload caps (bytes), enforced while streaming by settlements_app.uploads
+DOCUMENT_UPLOAD_MAX_SIZE = 100 * 1024 * 1024  # A whole settlement's documents in one request
+INSTRUCTION_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+CHAT_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+
+# Admin changelists above this many rows (by planner estimate) show an estimated
+# count instead of running COUNT(*); see settlements_app.pagination
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+
+# Dotted path to a callable run in the background with each new Document
+# (e.g. a virus scanner); empty to skip scanning
+DOCUMENT_SCAN_HOOK = os.getenv("DOCUMENT_SCAN_HOOK", "")
+
 MEDIA_URL = '/media/'
+# Documents are downloaded through settlements_app's download_document view, which hands the
+# transfer to the web server: "nginx" (X-Accel-Redirect to an `internal` location aliasing
+# MEDIA_ROOT at PROTECTED_MEDIA_INTERNAL_URL) or "apache" (mod_xsendfile). Empty = Django streams it.
+PROTECTED_MEDIA_SERVER = os.environ.get("PROTECTED_MEDIA_SERVER", "")
+PROTECTED_MEDIA_INTERNAL_URL = "/protected-media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 # Ensure media directory permissions
@@ -128,6 +202,36 @@ EMAIL_HOST_USER = 'info@onestoplegal.com.au'
 EMAIL_HOST_PASSWORD = 'bxkystkrmmrcpdyz'
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Chat long-polling: how long a poll is held open waiting for a wakeup, and
+# the notifier used to publish wakeups (Redis is required with several workers;
+# startup fails otherwise, see settlements_app.notifier.check_notifier_backend)
+CHAT_LONG_POLL_TIMEOUT = 25  # seconds
+# Parked polls each hold a server thread, so at most this many park per process
+# (uwsgi.ini: 16 threads, leaving 4 for pages). Once full, polls answer at once
+# and the widget re-polls after CHAT_LONG_POLL_BUSY_RETRY seconds. With 4
+# processes that is 48 open chat tabs held for free; beyond that, serve
+# /ws/chat/ from an ASGI server (daphne Settlex.asgi:application).
+CHAT_LONG_POLL_MAX_PARKED = 12
+CHAT_LONG_POLL_BUSY_RETRY = 5  # seconds
+REDIS_URL = os.environ.get("REDIS_URL", "")
+CHAT_NOTIFIER_BACKEND = (
+    "settlements_app.notifier.RedisChatNotifier" if REDIS_URL
+    else "settlements_app.notifier.LocalChatNotifier"
+)
+
+# Channel layer for the WebSocket chat transport (Settlex.asgi); polling stays as the fallback
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": [REDIS_URL]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+    }
+
 # Authentication Backend
 AUTHENTICATION_BACKENDS = [
     'settlements_app.backends.EmailOrUsernameModelBackend',
@@ -142,11 +246,37 @@ LOGOUT_REDIRECT_URL = reverse_lazy("settlements_app:home")
 
 
 
+# Shared cache (sessions, 2FA and context-processor caches); Redis when configured
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    }
+
 # Extend session duration to avoid logout on refresh
 SESSION_COOKIE_AGE = 86400  # 24 hours
-SESSION_SAVE_EVERY_REQUEST = True
+# Rolling expiry is handled by ThrottledSessionMiddleware: every request refreshes it,
+# except the chat polling views below, which only move the expiry, at most once per interval
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_REFRESH_INTERVAL = 300  # seconds
+SESSION_REFRESH_THROTTLED_VIEWS = (
+    "settlements_app:long_poll_messages",
+    "settlements_app:chat_typing",
+    "settlements_app:check_new_messages",
+)
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
-SESSION_ENGINE = "django.contrib.sessions.backends.db"
+# Session reads are served from Redis with cached_db; a per-process LocMem cache
+# would serve stale sessions across workers, so fall back to the database alone
+SESSION_ENGINE = (
+    "django.contrib.sessions.backends.cached_db" if REDIS_URL
+    else "django.contrib.sessions.backends.db"
+)
 SESSION_COOKIE_SECURE = True  # Ensure this is True in production with HTTPS
 SESSION_COOKIE_SAMESITE = 'Lax'
 
@@ -1,8 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
 from two_factor import urls as tf_urls
-from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 from settlements_app.views import (
     SettlexTwoFactorLoginView,
@@ -36,5 +34,5 @@ urlpatterns = [
     path("", include(("settlements_app.urls", "settlements_app"), namespace="settlements_app")),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# MEDIA_URL is deliberately not served: uploads go through the login- and
+# firm-checked views in settlements_app (see downloads.serve_protected_file).
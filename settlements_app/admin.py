@@ -1,19 +1,35 @@
 from django.contrib import admin
 from django.contrib import messages
+from django.core.exceptions import PermissionDenied
 from django.shortcuts import render, get_object_or_404
 from django.urls import path, reverse
 from django.utils.html import format_html
-from django.http import HttpResponseRedirect
+from django.utils.timezone import now
+from django.http import HttpResponseRedirect, JsonResponse
 from django.contrib.auth.models import User
-from django.views.decorators.csrf import csrf_exempt
-from django.utils.decorators import method_decorator
-from .models import Solicitor, Instruction, Document, Firm, ChatMessage
+from django.db.models import Case, CharField, Value, When
+from django.db.models.functions import Coalesce, Concat, NullIf, Trim
+from .models import Solicitor, Instruction, Document, Firm, ChatMessage, OutboundEmail, DeadLetterEmail, Blob
+from .admin_filters import AutocompleteFilter, AutocompleteFilterMixin, YearFilter
+from .chat import (
+    advance_read_watermark, conversation_summaries, mark_conversations_read, parse_message_cursor, set_typing,
+)
+from .mail import build_mail
+from .pagination import EstimatedCountPaginator
 import logging
-from django.core.mail import send_mail
 from django.conf import settings  # ✅ Ensure settings are available
 
 logger = logging.getLogger(__name__)
 
+# How often the admin chat inbox polls for conversations with new messages
+INBOX_REFRESH_SECONDS = 15
+
+
+def user_display_name(prefix):
+    """SQL equivalent of ``get_full_name() or username`` for the user at ``prefix``."""
+    full_name = Trim(Concat(f"{prefix}__first_name", Value(" "), f"{prefix}__last_name", output_field=CharField()))
+    return Coalesce(NullIf(full_name, Value("")), f"{prefix}__username")
+
 # ✅ Register Firm Model
 @admin.register(Firm)
 class FirmAdmin(admin.ModelAdmin):
@@ -24,23 +40,32 @@ class FirmAdmin(admin.ModelAdmin):
 
 # ✅ Register Solicitor Model
 @admin.register(Solicitor)
-class SolicitorAdmin(admin.ModelAdmin):
+class SolicitorAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ("instructing_solicitor", "get_firm_name", "office_phone", "mobile_phone", "profession")
     search_fields = ("instructing_solicitor", "firm__name")
-    list_filter = ("firm",)
+    list_filter = (("firm", AutocompleteFilter),)
+
+    def get_queryset(self, request):
+        # Solicitor.__str__ shows the firm, in the changelist and in autocomplete results alike
+        return super().get_queryset(request).select_related("firm")
 
     def get_firm_name(self, obj):
         return obj.firm.name if obj.firm else "No Firm Assigned"
     get_firm_name.short_description = "Firm Name"
+    get_firm_name.admin_order_field = "firm__name"
 
 
 # ✅ Register Instruction Model
 @admin.register(Instruction)
-class InstructionAdmin(admin.ModelAdmin):
+class InstructionAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ("file_reference", "purchaser_name", "property_address", "settlement_date", "status", "solicitor")
     search_fields = ("purchaser_name", "property_address", "seller_name", "file_reference")
-    list_filter = ("status", "settlement_date", "solicitor")
+    list_filter = ("status", ("solicitor", AutocompleteFilter), ("settlement_date", YearFilter))
+    autocomplete_fields = ("solicitor",)
     list_editable = ("status",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ("solicitor__firm",)  # Solicitor.__str__ shows the firm
 
 
 # ✅ Register Document Model
@@ -49,30 +74,60 @@ class DocumentAdmin(admin.ModelAdmin):
     list_display = ("name", "instruction", "uploaded_at")
     search_fields = ("name", "instruction__file_reference")
     list_filter = ("uploaded_at",)
+    list_select_related = ("instruction",)
+
+
+# ✅ Content-addressed file blobs (read-only; managed by Document/ChatMessage saves and deletes)
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ("sha256", "file", "size", "ref_count", "created_at")
+    search_fields = ("sha256",)
+    readonly_fields = ("sha256", "file", "size", "ref_count", "created_at")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 # ✅ Register Chat Messages in Admin
 @admin.register(ChatMessage)
-class ChatMessageAdmin(admin.ModelAdmin):
+class ChatMessageAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ("sender_name", "recipient_name", "message_preview", "timestamp", "reply_button")
     search_fields = ("sender__username", "recipient__username", "message")
-    list_filter = ("timestamp",)
+    list_filter = (("sender", AutocompleteFilter), ("recipient", AutocompleteFilter), ("timestamp", YearFilter))
     ordering = ("-timestamp",)
-    readonly_fields = ('is_read',)  # Make is_read read-only to prevent manual toggling
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ("sender", "recipient")  # ChatMessage.__str__ (row checkbox labels) reads both
+
+    def get_queryset(self, request):
+        # Display names are computed in SQL so the changelist needs no per-row user lookups
+        return super().get_queryset(request).annotate(
+            sender_display=Case(
+                When(sender__is_superuser=True, then=Value("Settlex (Admin)")),
+                default=user_display_name("sender"),
+            ),
+            recipient_display=user_display_name("recipient"),
+        )
 
     def sender_name(self, obj):
         """Display sender name as 'Settlex' if admin sent the message."""
-        return "Settlex (Admin)" if obj.sender.is_superuser else (obj.sender.get_full_name() or obj.sender.username)
+        return obj.sender_display
     sender_name.short_description = "Sender"
+    sender_name.admin_order_field = "sender_display"
 
     def recipient_name(self, obj):
         """Display recipient name properly."""
-        return obj.recipient.get_full_name() or obj.recipient.username
+        return obj.recipient_display
     recipient_name.short_description = "Recipient"
+    recipient_name.admin_order_field = "recipient_display"
 
     def message_preview(self, obj):
         """Display a short preview of the message in Admin."""
-        return obj.message[:50] + "..." if len(obj.message) > 50 else obj.message
+        message = obj.message or ""
+        return message[:50] + "..." if len(message) > 50 else message
     message_preview.short_description = "Message Preview"
 
     def reply_button(self, obj):
@@ -92,10 +147,57 @@ class ChatMessageAdmin(admin.ModelAdmin):
         urls = super().get_urls()
         custom_urls = [
             path('chatmessage/<int:message_id>/reply/', self.admin_site.admin_view(self.reply_view), name="chat_reply"),
+            path('inbox/', self.admin_site.admin_view(self.inbox_view), name="chat_inbox"),
+            path('inbox/updates/', self.admin_site.admin_view(self.inbox_updates), name="chat_inbox_updates"),
         ]
         return custom_urls + urls
 
-    @method_decorator(csrf_exempt)
+    def inbox_conversations(self, since_message_id=0):
+        conversations = conversation_summaries(since_message_id)
+        for conversation in conversations:
+            conversation["reply_url"] = (
+                reverse("admin:chat_reply", args=[conversation["last_incoming_id"]])
+                if conversation["last_incoming_id"] else ""
+            )
+        return conversations
+
+    def inbox_view(self, request):
+        """Every open conversation with its unread count and latest message; POST marks conversations read."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        if request.method == "POST":
+            if not self.has_change_permission(request):
+                raise PermissionDenied
+            user_ids = [int(user_id) for user_id in request.POST.getlist("user_ids") if user_id.isdigit()]
+            if user_ids:
+                updated = mark_conversations_read(user_ids)
+                messages.success(request, f"{updated} conversation(s) marked as read.")
+            return HttpResponseRedirect(reverse("admin:chat_inbox"))
+
+        conversations = self.inbox_conversations()
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Chat inbox",
+            "opts": self.model._meta,
+            "conversations": conversations,
+            "cursor": max((c["last_message_id"] for c in conversations), default=0),
+            "refresh_seconds": INBOX_REFRESH_SECONDS,
+        }
+        return render(request, "admin/chat_inbox.html", context)
+
+    def inbox_updates(self, request):
+        """Conversations with messages newer than ``?since=`` (the inbox page's incremental refresh)."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        since = parse_message_cursor(request.GET.get("since"))
+        conversations = self.inbox_conversations(since)
+        return JsonResponse({
+            "status": "success",
+            "conversations": conversations,
+            "cursor": max([since] + [c["last_message_id"] for c in conversations]),
+        })
+
     def reply_view(self, request, message_id):
         """Handle message replies from admin."""
         message = get_object_or_404(ChatMessage, id=message_id)
@@ -110,9 +212,13 @@ class ChatMessageAdmin(admin.ModelAdmin):
                     recipient=message.sender,  # Replying back to sender
                     message=reply_text
                 )
+                # Replying answers everything the user has sent so far
+                mark_conversations_read([message.sender_id])
+                # The reply is sent, so the user's widget stops showing staff typing
+                set_typing(request.user, False, message.sender_id)
 
                 messages.success(request, "Reply sent successfully!")
-                return HttpResponseRedirect(reverse("admin:settlements_app_chatmessage_changelist"))
+                return HttpResponseRedirect(reverse("admin:chat_inbox"))
 
         # ✅ Fix: Add "subtitle" to context
         context = {
@@ -124,9 +230,8 @@ class ChatMessageAdmin(admin.ModelAdmin):
     def change_view(self, request, object_id, form_url='', extra_context=None):
         """Automatically mark message as read when admin views it."""
         message = self.get_object(request, object_id)
-        if message and not message.is_read and request.user.is_staff:
-            message.is_read = True
-            message.save()
+        if message and request.user.is_staff and not message.sender.is_staff:
+            advance_read_watermark(message.sender_id, "staff", message.id)
         return super().change_view(request, object_id, form_url, extra_context)
 
     class Media:
@@ -135,12 +240,13 @@ class ChatMessageAdmin(admin.ModelAdmin):
 
 # ✅ Define a custom action to send activation email
 def send_activation_email(modeladmin, request, queryset):
-    for user in queryset:
+    emails = []
+    for user in queryset.only("email", "first_name", "last_name", "is_active"):
         if not user.is_active:
             messages.warning(request, f"User {user.email} is not active. Activate the user before sending email.")
             continue  # Skip inactive users
 
-        # ✅ Send activation email
+        # ✅ Queue activation email (delivered by the send_queued_mail worker)
         subject = "Your SettleX Account Has Been Activated"
         message = f"""
         Dear {user.first_name} {user.last_name},
@@ -152,28 +258,55 @@ def send_activation_email(modeladmin, request, queryset):
         Regards,
         SettleX Team
         """
+        emails.append(build_mail(subject, message, [user.email]))
 
-        try:
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=False,
-            )
-            messages.success(request, f"Activation email sent to {user.email}")
-
-        except Exception as e:
-            messages.error(request, f"Failed to send activation email to {user.email}: {e}")
+    OutboundEmail.objects.bulk_create(emails)
+    if emails:
+        messages.success(request, f"Activation email queued for {len(emails)} user(s)")
 
 send_activation_email.short_description = "✅ Send Activation Email"
 
 # ✅ Register the User model with the custom admin action
 class UserAdmin(admin.ModelAdmin):
     list_display = ("username", "email", "is_active")
+    search_fields = ("username", "email", "first_name", "last_name")  # Also backs the chat sender/recipient filters
     list_filter = ("is_active",)
     actions = [send_activation_email]  # ✅ Add the action to the dropdown
 
 # ✅ Unregister default User admin and register our custom one
 admin.site.unregister(User)
-admin.site.register(User, UserAdmin)
\ No newline at end of file
+admin.site.register(User, UserAdmin)
+
+
+# ✅ Outbound email queue
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ("subject", "recipient_list", "status", "attempts", "next_attempt_at", "created_at", "sent_at")
+    search_fields = ("subject", "recipients")
+    list_filter = ("status",)
+    ordering = ("-created_at",)
+    readonly_fields = ("subject", "body", "from_email", "recipients", "status", "attempts",
+                       "next_attempt_at", "last_error", "created_at", "sent_at")
+    actions = ["retry_now"]
+
+    def recipient_list(self, obj):
+        return ", ".join(obj.recipients)
+    recipient_list.short_description = "Recipients"
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="🔁 Retry delivery now")
+    def retry_now(self, request, queryset):
+        count = queryset.exclude(status="sent").update(status="pending", attempts=0, next_attempt_at=now())
+        messages.success(request, f"{count} email(s) queued for another delivery attempt.")
+
+
+# ✅ Dead-letter view: emails that exhausted their delivery attempts
+@admin.register(DeadLetterEmail)
+class DeadLetterEmailAdmin(OutboundEmailAdmin):
+    list_display = ("subject", "recipient_list", "attempts", "last_error", "created_at")
+    list_filter = ()
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(status="failed")
@@ -15,3 +15,13 @@ class SettlementsAppConfig(AppConfig):
         # Import signals to ensure the signals are registered
         import settlements_app.signals
 
+        # Chat wakeups and cache invalidations must reach every worker process
+        from .deployment import check_shared_cache
+        from .notifier import check_notifier_backend
+        check_notifier_backend()
+        check_shared_cache()
+
+        from .previews import pdfium
+        if pdfium is None:
+            logger.warning("⚠️ pypdfium2 is not installed: PDF documents get no thumbnail or text preview")
+
@@ -0,0 +1,394 @@
+import logging
+from datetime import timedelta
+
+import pytz
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, Count, F, Max, Min, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils.timezone import now, localtime
+
+from .models import ChatMessage, ChatReadState
+from .notifier import notify_users
+
+logger = logging.getLogger(__name__)
+
+BRISBANE_TZ = pytz.timezone("Australia/Brisbane")
+
+# How far back the first sync of a chat widget reaches.
+CHAT_HISTORY_DAYS = 7
+
+# Seconds a typing flag lives without a refresh; clients re-send it while typing.
+TYPING_TIMEOUT = 6
+
+# Seconds the last written read watermark of a conversation is remembered,
+# so repeated receipts for the same messages skip the database.
+READ_RECEIPT_CACHE_TIMEOUT = 300
+
+# Most conversations listed in the admin chat inbox (newest activity first).
+INBOX_SIZE = 200
+INBOX_PREVIEW_LENGTH = 80
+
+
+def parse_message_cursor(value):
+    """Parse the ``last_message_id`` cursor sent by the chat widget."""
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_message_ids(values):
+    """Message ids from a client-supplied list; anything that is not a list of ids yields none."""
+    if not isinstance(values, list):
+        return []
+    return [int(value) for value in values if str(value).isdecimal() and int(value) < 2 ** 63]
+
+
+def conversation_messages(user):
+    """All chat messages the user has sent or received."""
+    return ChatMessage.objects.filter(Q(sender=user) | Q(recipient=user))
+
+
+def visible_messages(user):
+    """Chat messages whose files ``user`` may open: staff see every conversation."""
+    if user.is_staff:
+        return ChatMessage.objects.all()
+    return conversation_messages(user)
+
+
+def chat_file_url(message_id):
+    """Protected URL of a chat message's attachment (files are never served from MEDIA_URL)."""
+    return reverse("settlements_app:chat_file", args=[message_id])
+
+
+def history_messages(user, since):
+    """Messages of the user's conversation sent since ``since`` (first sync)."""
+    return conversation_messages(user).filter(timestamp__gte=since).order_by("timestamp")
+
+
+def unread_messages(user):
+    """Messages addressed to ``user`` by someone else that are past the read watermark of their conversation."""
+    if user.is_staff:
+        watermark = ChatReadState.objects.filter(user=OuterRef("sender")).values("staff_read_up_to")
+    else:
+        watermark = ChatReadState.objects.filter(user=user).values("user_read_up_to")
+    return (
+        ChatMessage.objects.filter(recipient=user, id__gt=Coalesce(Subquery(watermark[:1]), 0))
+        .exclude(sender=user)
+    )
+
+
+def with_read_flags(queryset):
+    """
+    Annotate ``is_read`` from the watermarks: a staff message is read once its
+    recipient's watermark reaches it, a user's message once the staff one does.
+    """
+    user_read = ChatReadState.objects.filter(user=OuterRef("recipient")).values("user_read_up_to")
+    staff_read = ChatReadState.objects.filter(user=OuterRef("sender")).values("staff_read_up_to")
+    return queryset.annotate(is_read=Case(
+        When(sender__is_staff=True, id__lte=Coalesce(Subquery(user_read[:1]), 0), then=Value(True)),
+        When(sender__is_staff=False, id__lte=Coalesce(Subquery(staff_read[:1]), 0), then=Value(True)),
+        default=Value(False),
+        output_field=BooleanField(),
+    ))
+
+
+# Columns projected by chat serialization: the sender and recipient names are
+# read through the join, so a page of messages costs a single query.
+MESSAGE_FIELDS = (
+    "id",
+    "message",
+    "file",
+    "is_read",
+    "timestamp",
+    "sender_id",
+    "sender__username",
+    "sender__first_name",
+    "sender__last_name",
+    "recipient__username",
+    "recipient__first_name",
+    "recipient__last_name",
+)
+
+
+def _display_name(first_name, last_name, username):
+    """Mirror ``User.get_full_name() or User.username`` for projected rows."""
+    return f"{first_name} {last_name}".strip() or username
+
+
+def serialize_messages(queryset, user):
+    """Convert a ChatMessage queryset into the JSON shape used by the chat widget."""
+    return [
+        {
+            "id": row["id"],
+            "sender_name": _display_name(row["sender__first_name"], row["sender__last_name"], row["sender__username"]),
+            "sender_username": row["sender__username"],
+            "recipient_name": _display_name(
+                row["recipient__first_name"], row["recipient__last_name"], row["recipient__username"]),
+            "message": row["message"],
+            "timestamp": localtime(row["timestamp"], BRISBANE_TZ).strftime("%d %b %Y, %I:%M %p"),
+            "is_read": row["is_read"],
+            "user_role": "sender" if row["sender_id"] == user.id else "recipient",
+            "file_url": chat_file_url(row["id"]) if row["file"] else None,
+        }
+        for row in with_read_flags(queryset).values(*MESSAGE_FIELDS)
+    ]
+
+
+def build_chat_delta(user, last_message_id=0):
+    """
+    Build the incremental chat payload for ``user``.
+
+    ``last_message_id`` is the highest message id the client already holds:
+    only newer messages are returned (a zero cursor returns the recent history).
+    ``read_up_to`` is the id up to which the user's own messages show as
+    read: how far staff have read the conversation or, for staff, how far
+    their recipients have read (see sent_read_up_to). ``is_typing`` tells a
+    (non-staff) user whether staff are typing to them. The response carries
+    the cursor for the next call.
+    """
+    if last_message_id:
+        new_messages = conversation_messages(user).filter(id__gt=last_message_id).order_by("id")
+    else:
+        new_messages = history_messages(user, now() - timedelta(days=CHAT_HISTORY_DAYS))
+
+    messages_data = serialize_messages(new_messages, user)
+
+    if messages_data:
+        last_message_id = max(last_message_id, max(msg["id"] for msg in messages_data))
+
+    return {
+        "status": "success",
+        "messages": messages_data,
+        "read_up_to": sent_read_up_to(user) if user.is_staff else read_watermarks(user.id)[1],
+        "is_typing": peer_is_typing(user),
+        "last_message_id": last_message_id,
+    }
+
+
+def typing_cache_key(user_id):
+    """Staff typing flag in the conversation between user ``user_id`` and staff."""
+    return f"chat_typing:{user_id}"
+
+
+def set_typing(user, is_typing, conversation_user_id):
+    """
+    Record that staff member ``user`` started or stopped typing into the
+    conversation of ``conversation_user_id``. Only staff typing is shown (in
+    the user's chat widget), so anyone else is ignored. The flag expires after
+    ``TYPING_TIMEOUT`` unless refreshed; the user is woken so a parked sync
+    returns the new state.
+    """
+    if not user.is_staff or not conversation_user_id:
+        return
+    key = typing_cache_key(conversation_user_id)
+    if is_typing:
+        cache.set(key, True, TYPING_TIMEOUT)
+    else:
+        cache.delete(key)
+    notify_users(conversation_user_id)
+
+
+def peer_is_typing(user):
+    """Whether staff are typing to ``user`` (always False for staff, who follow typing per conversation)."""
+    if user.is_staff:
+        return False
+    return bool(cache.get(typing_cache_key(user.id)))
+
+
+def read_watermarks(conversation_user_id):
+    """``(user_read_up_to, staff_read_up_to)`` of a conversation; ``(0, 0)`` until something is read."""
+    state = (
+        ChatReadState.objects.filter(user_id=conversation_user_id)
+        .values_list("user_read_up_to", "staff_read_up_to")
+        .first()
+    )
+    return state or (0, 0)
+
+
+def sent_read_up_to(staff_user):
+    """
+    Read watermark of the messages ``staff_user`` sent to users: every one up
+    to the returned id has been read by its recipient. Staff write to many
+    conversations, so this is the lowest user watermark among conversations
+    whose latest message from ``staff_user`` is still unread (or their newest
+    message when all are read). Messages between staff are not read-tracked
+    and are left out.
+
+    One query over conversations (a user row and its read state each), with a
+    subquery reading the latest message to each user through the chat
+    indexes, so the cost does not grow with the staff member's history.
+    """
+    latest_sent = ChatMessage.objects.filter(sender=staff_user, recipient=OuterRef("pk")).order_by("-id")
+    bounds = (
+        User.objects.filter(is_staff=False)
+        .annotate(
+            read_up_to=Coalesce(F("chat_read_state__user_read_up_to"), 0),
+            latest_sent=Subquery(latest_sent.values("id")[:1]),
+        )
+        .aggregate(
+            unread_from=Min("read_up_to", filter=Q(latest_sent__gt=F("read_up_to"))),
+            newest=Max("latest_sent"),
+        )
+    )
+    if bounds["unread_from"] is not None:
+        return bounds["unread_from"]
+    return bounds["newest"] or 0
+
+
+def advance_read_watermark(conversation_user_id, side, up_to):
+    """
+    Move the ``side`` ("user" or "staff") watermark of a conversation forward
+    to ``up_to`` with one conditional UPDATE; it never moves back. ``up_to`` is
+    first clamped to the newest message that side has received, so a receipt
+    cannot cover messages sent after it. When it moved, wakes the user (and,
+    for the user's side, the staff member whose message was read).
+
+    Returns the clamped id, which the stored watermark now covers (0 when that
+    side has received nothing up to ``up_to``).
+    """
+    received = ChatMessage.objects.filter(id__lte=up_to)
+    if side == "staff":
+        received = received.filter(sender_id=conversation_user_id)
+    else:
+        received = received.filter(recipient_id=conversation_user_id).exclude(sender_id=conversation_user_id)
+    newest = received.order_by("-id").values_list("id", "sender_id").first()
+    if newest is None:
+        return 0
+    up_to, sender_id = newest
+
+    field = f"{side}_read_up_to"
+    behind = ChatReadState.objects.filter(user_id=conversation_user_id, **{f"{field}__lt": up_to})
+    if not behind.update(**{field: up_to, "updated_at": now()}):
+        _, created = ChatReadState.objects.get_or_create(user_id=conversation_user_id, defaults={field: up_to})
+        if not created and not behind.update(**{field: up_to, "updated_at": now()}):
+            return up_to  # Already read that far
+    notify_users(conversation_user_id, *([sender_id] if side == "user" else []))
+    return up_to
+
+
+def read_receipt_cache_key(user_id, side):
+    """How far ``side`` is known to have read user ``user_id``'s conversation (at most the stored watermark)."""
+    return f"chat_read:{user_id}:{side}"
+
+
+def record_read_receipt(conversation_user_id, side, up_to):
+    """
+    Record that ``side`` has read a conversation up to message ``up_to``.
+
+    The watermark is written straight away by advance_read_watermark, whose
+    conditional UPDATE only ever raises it, so concurrent receipts cannot
+    lower it and nothing is lost on a restart. Receipts already covered by
+    an earlier one (the widget re-sends its newest message) cost no query:
+    the watermark last written is remembered in the cache. That value can
+    only lag the stored one, so a stale entry costs an extra UPDATE at worst.
+    """
+    key = read_receipt_cache_key(conversation_user_id, side)
+    if up_to <= (cache.get(key) or 0):
+        return
+    written = advance_read_watermark(conversation_user_id, side, up_to)
+    if written:
+        cache.set(key, written, READ_RECEIPT_CACHE_TIMEOUT)
+
+
+def mark_messages_read(user, message_ids):
+    """
+    Record that ``user`` has read the given messages. Only the newest message
+    per conversation matters, as a read receipt for that conversation's
+    watermark. Returns the number of conversations with a receipt.
+    """
+    if not message_ids:
+        return 0
+    if not user.is_staff:
+        record_read_receipt(user.id, "user", max(message_ids))
+        return 1
+    conversations = list(
+        ChatMessage.objects.filter(id__in=message_ids, recipient=user, sender__is_staff=False)
+        .values("sender_id").annotate(up_to=Max("id")).order_by()
+    )
+    for conversation in conversations:
+        record_read_receipt(conversation["sender_id"], "staff", conversation["up_to"])
+    return len(conversations)
+
+
+def mark_all_read(user):
+    """
+    Record that ``user`` has read everything addressed to them: one query for
+    the unread count and newest unread message per conversation, then a read
+    receipt per conversation. Returns how many messages were unread.
+    """
+    conversations = list(
+        unread_messages(user).values("sender_id").annotate(count=Count("id"), up_to=Max("id")).order_by()
+    )
+    for conversation in conversations:
+        if user.is_staff:
+            record_read_receipt(conversation["sender_id"], "staff", conversation["up_to"])
+        else:
+            record_read_receipt(user.id, "user", conversation["up_to"])
+    return sum(conversation["count"] for conversation in conversations)
+
+
+def conversation_summaries(since_message_id=0, limit=INBOX_SIZE):
+    """
+    One summary per non-staff user who has chatted with staff, newest activity
+    first: the latest message, the user's latest message (the one staff reply
+    to) and how many of the user's messages are unread.
+
+    Everything comes from a single query over users, with correlated
+    subqueries that each read a few rows through the chat indexes. Only
+    conversations with a message newer than ``since_message_id`` are returned,
+    so the inbox can refresh incrementally.
+    """
+    latest = ChatMessage.objects.filter(Q(sender=OuterRef("pk")) | Q(recipient=OuterRef("pk"))).order_by("-id")
+    latest_incoming = ChatMessage.objects.filter(sender=OuterRef("pk")).order_by("-id")
+    unread = (
+        ChatMessage.objects.filter(sender=OuterRef("pk"), id__gt=OuterRef("staff_read_up_to"))
+        .order_by().values("sender").annotate(count=Count("id")).values("count")
+    )
+    users = (
+        User.objects.filter(is_staff=False)
+        .annotate(staff_read_up_to=Coalesce(F("chat_read_state__staff_read_up_to"), 0))
+        .annotate(
+            last_message_id=Subquery(latest.values("id")[:1]),
+            last_message=Subquery(latest.values("message")[:1]),
+            last_file=Subquery(latest.values("file")[:1]),
+            last_timestamp=Subquery(latest.values("timestamp")[:1]),
+            last_incoming_id=Subquery(latest_incoming.values("id")[:1]),
+            unread_count=Coalesce(Subquery(unread), 0),
+        )
+        .filter(last_message_id__gt=since_message_id)
+        .order_by("-last_message_id")
+        .only("id", "username", "first_name", "last_name")
+    )
+    return [
+        {
+            "user_id": user.id,
+            "name": _display_name(user.first_name, user.last_name, user.username),
+            "preview": (user.last_message or ("📎 File" if user.last_file else ""))[:INBOX_PREVIEW_LENGTH],
+            "timestamp": localtime(user.last_timestamp, BRISBANE_TZ).strftime("%d %b %Y, %I:%M %p"),
+            "unread_count": user.unread_count,
+            "last_message_id": user.last_message_id,
+            "last_incoming_id": user.last_incoming_id,
+        }
+        for user in users[:limit]
+    ]
+
+
+def mark_conversations_read(user_ids):
+    """
+    Move the staff watermark of each given (non-staff) user's conversation to
+    the user's latest message, straight away: one INSERT for conversations
+    without read state yet and one UPDATE for all of them. Wakes the users and
+    returns how many conversations had unread messages.
+    """
+    user_ids = list(User.objects.filter(pk__in=user_ids, is_staff=False).values_list("pk", flat=True))
+    ChatReadState.objects.bulk_create([ChatReadState(user_id=pk) for pk in user_ids], ignore_conflicts=True)
+    latest = Subquery(ChatMessage.objects.filter(sender=OuterRef("user")).order_by("-id").values("id")[:1])
+    updated = (
+        ChatReadState.objects.filter(user_id__in=user_ids, staff_read_up_to__lt=latest)
+        .update(staff_read_up_to=latest, updated_at=now())
+    )
+    notify_users(*user_ids)
+    return updated
@@ -0,0 +1,76 @@
+import logging
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .chat import build_chat_delta, mark_messages_read, parse_message_cursor, parse_message_ids, set_typing
+from .notifier import chat_group_name
+
+logger = logging.getLogger(__name__)
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Pushes chat messages, read receipts and typing state over a WebSocket.
+
+    The client sends ``{"type": "sync", "last_message_id": ...}`` with the
+    cursor it already holds; from then on every wakeup published for the user
+    is answered with the same incremental payload the polling endpoint
+    returns, read watermark and typing flag included. ``typing`` frames record
+    staff typing (with the ``user_id`` of the conversation) and ``read``
+    frames are read receipts. Idle connections cost no worker thread.
+    """
+
+    async def connect(self):
+        self.user = self.scope.get("user")
+        if not self.user or not self.user.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        self.last_message_id = 0
+        self.read_up_to = 0
+        self.peer_typing = False
+        self.synced = False
+        self.groups_joined = [chat_group_name(self.user.id)]
+        for group in self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+        await self.accept()
+        logger.debug("🔌 Chat WebSocket connected for user %s", self.user)
+
+    async def disconnect(self, code):
+        for group in getattr(self, "groups_joined", []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        if not isinstance(content, dict):
+            return  # Ignore malformed frames rather than dropping the connection
+        kind = content.get("type")
+
+        if kind == "sync":
+            self.last_message_id = parse_message_cursor(content.get("last_message_id"))
+            self.synced = True
+            await self.push_delta(always=True)
+
+        elif kind == "read":
+            message_ids = parse_message_ids(content.get("message_ids"))
+            if message_ids:
+                await database_sync_to_async(mark_messages_read)(self.user, message_ids)
+
+        elif kind == "typing" and self.user.is_staff:
+            # Stored for the user's next sync; set_typing wakes their long-poll or socket
+            recipient_id = parse_message_cursor(content.get("user_id"))
+            await database_sync_to_async(set_typing)(self.user, bool(content.get("is_typing")), recipient_id)
+
+    async def push_delta(self, always=False):
+        payload = await database_sync_to_async(build_chat_delta)(self.user, self.last_message_id)
+        self.last_message_id = payload["last_message_id"]
+        read_changed = payload["read_up_to"] != self.read_up_to
+        self.read_up_to = payload["read_up_to"]
+        typing_changed = payload["is_typing"] != self.peer_typing
+        self.peer_typing = payload["is_typing"]
+        if always or payload["messages"] or read_changed or typing_changed:
+            await self.send_json({**payload, "type": "sync"})
+
+    async def chat_wakeup(self, event):
+        if self.synced:
+            await self.push_delta()
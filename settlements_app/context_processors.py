@@ -1,5 +1,12 @@
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
 from .models import Instruction
 
+# Seconds a user's latest instruction stays cached; Instruction signals invalidate it sooner.
+LATEST_INSTRUCTION_CACHE_TIMEOUT = 300
+_MISSING = object()
+
 def chat_visibility(request):
     """
     Controls whether the chat widget should be shown based on the current path.
@@ -23,18 +30,31 @@ def chat_visibility(request):
     }
 
 
+def latest_instruction_cache_key(user_id):
+    return f"latest_instruction:{user_id}"
+
+
+def get_latest_instruction(user_id):
+    """
+    Returns the user's most recent instruction (or None), cached per user.
+    """
+    key = latest_instruction_cache_key(user_id)
+    latest = cache.get(key, _MISSING)
+    if latest is _MISSING:
+        latest = Instruction.objects.filter(solicitor__user_id=user_id).order_by('-pk').first()
+        cache.set(key, latest, LATEST_INSTRUCTION_CACHE_TIMEOUT)
+    return latest
+
+
 def latest_instruction(request):
     """
     Adds the user's latest instruction to the template context.
+
+    The value is lazy, so templates that never use it run no query or cache lookup.
     """
     if request.user.is_authenticated:
-        try:
-            solicitor = request.user.solicitor  # This assumes a OneToOne link: Solicitor.user
-            latest = Instruction.objects.filter(solicitor=solicitor).last()
-        except Exception:
-            latest = None
-
+        user_id = request.user.id
         return {
-            'latest_instruction': latest
+            'latest_instruction': SimpleLazyObject(lambda: get_latest_instruction(user_id))
         }
-    return {}
\ No newline at end of file
+    return {}
@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from functools import wraps
 
+from .uploads import HashingUploadHandler
+
 def login_required_json(view_func):
     @wraps(view_func)
     def wrapper(request, *args, **kwargs):
@@ -8,3 +12,24 @@ def login_required_json(view_func):
             return JsonResponse({'error': 'Authentication required'}, status=401)
         return view_func(request, *args, **kwargs)
     return wrapper
+
+
+def streaming_upload(max_size_setting):
+    """
+    Handle the view's file uploads with HashingUploadHandler, capped at the byte
+    size in ``settings.<max_size_setting>``.
+
+    Upload handlers must be installed before the body is parsed, so CSRF
+    checking (which reads request.POST) is moved inside the wrapper.
+    """
+    def decorator(view_func):
+        protected_view = csrf_protect(view_func)
+
+        @csrf_exempt
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            max_size = getattr(settings, max_size_setting)
+            request.upload_handlers = [HashingUploadHandler(request, max_size)]
+            return protected_view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,22 @@
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+
+from .notifier import server_processes
+
+
+def check_shared_cache():
+    """
+    Refuse to start with a per-process (LocMem) default cache under several
+    worker processes. Cached per-user state such as the 2FA device flag
+    (devices.py) and the latest instruction (context_processors.py) is
+    invalidated with cache.delete(), which would only reach the worker that
+    made the change and leave the others stale until the entry expires. Chat
+    typing flags (chat.set_typing) are set by one request and read by another,
+    which may be served by a different worker.
+    """
+    processes = server_processes()
+    if processes > 1 and isinstance(caches["default"], LocMemCache):
+        raise ImproperlyConfigured(
+            f"The default cache is per-process (LocMemCache), but {processes} processes are "
+            "running. Set REDIS_URL (or configure another shared cache) or run one process.")
@@ -0,0 +1,37 @@
+from django.core.cache import cache
+from two_factor.utils import default_device
+
+# Seconds a user's "has a default 2FA device" flag stays cached; device signals invalidate it sooner
+# (across workers, which is why several processes need a shared cache: see deployment.py).
+DEFAULT_DEVICE_CACHE_TIMEOUT = 300
+USER_HAS_DEFAULT_DEVICE_ATTR = "_settlex_has_default_device"
+
+
+def default_device_cache_key(user_id):
+    return f"has_default_device:{user_id}"
+
+
+def has_default_device(user):
+    """
+    Whether the user has a confirmed default OTP device, as ``two_factor.utils.default_device``.
+
+    The flag is cached per user (and memoized on the user object for the rest of
+    the request), so the 2FA gate runs no device queries on the hot path.
+    """
+    if not user or user.is_anonymous:
+        return False
+    if hasattr(user, USER_HAS_DEFAULT_DEVICE_ATTR):
+        return getattr(user, USER_HAS_DEFAULT_DEVICE_ATTR)
+
+    key = default_device_cache_key(user.pk)
+    has_device = cache.get(key)
+    if has_device is None:
+        has_device = default_device(user) is not None
+        cache.set(key, has_device, DEFAULT_DEVICE_CACHE_TIMEOUT)
+
+    setattr(user, USER_HAS_DEFAULT_DEVICE_ATTR, has_device)
+    return has_device
+
+
+def invalidate_default_device(user_id):
+    cache.delete(default_device_cache_key(user_id))
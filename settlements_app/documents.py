@@ -0,0 +1,59 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import Document, store_file_as_blob
+from .previews import generate_previews
+from .search import schedule_reindex
+from .tasks import run_in_background
+
+logger = logging.getLogger(__name__)
+
+
+def scan_document(document):
+    """
+    Passes a new document to the ``DOCUMENT_SCAN_HOOK`` callable (dotted path),
+    if one is configured. The hook is responsible for quarantining or
+    reporting anything it rejects.
+    """
+    if not settings.DOCUMENT_SCAN_HOOK:
+        return
+    import_string(settings.DOCUMENT_SCAN_HOOK)(document)
+
+
+def post_process_document(document_id):
+    """
+    Background work for a new document: previews for its blob, then the scan
+    hook. Files are already hashed while they stream in (see uploads.py).
+    """
+    document = Document.objects.select_related("blob").filter(pk=document_id).first()
+    if document is None:
+        return  # Deleted before the worker got to it
+    if document.blob_id:
+        generate_previews(document.blob_id)
+    scan_document(document)
+
+
+def bulk_create_documents(documents):
+    """
+    Saves several unsaved documents with one INSERT, storing each file as a
+    blob first. bulk_create() sends no signals, so the search reindex and
+    post-processing the post_save receivers would queue are scheduled here:
+    one reindex per instruction and one worker task per document.
+    """
+    with transaction.atomic():
+        for document in documents:
+            blob = store_file_as_blob(document)
+            if blob is not None:
+                document.sha256 = blob.sha256
+        created = Document.objects.bulk_create(documents)
+
+        for instruction_id in {document.instruction_id for document in created}:
+            schedule_reindex(instruction_id)
+        for document in created:
+            run_in_background(post_process_document, document.pk)
+
+    logger.info(f"📎 {len(created)} document(s) uploaded in one batch")
+    return created
@@ -0,0 +1,138 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+# For URLs whose content never changes (e.g. previews of content-addressed blobs)
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+# Types a browser may render inline; anything else (HTML, SVG, scripts...) is
+# forced to download, so uploaded content never runs on the app's origin
+INLINE_CONTENT_TYPES = {"application/pdf", "image/png", "image/jpeg", "image/gif", "image/webp", "text/plain"}
+
+
+def _content_type(name):
+    """Content type of a stored file if it may be shown inline, else None."""
+    content_type, encoding = mimetypes.guess_type(name)
+    return content_type if content_type in INLINE_CONTENT_TYPES and not encoding else None
+
+
+def _etag_matches(header, etag):
+    return header.strip() == "*" or etag in (tag.strip() for tag in header.split(","))
+
+
+def _parse_range(header, size):
+    """
+    ``(start, end)`` (inclusive) of a single ``bytes=`` range, None to serve the
+    whole file (missing, malformed or multi-range header), or False if the
+    range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        return (max(size - length, 0), size - 1) if length else False
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _file_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _send_with_python(request, name, etag, response_headers):
+    """Serve from Django, honouring If-None-Match, Range and If-Range."""
+    if etag and _etag_matches(request.headers.get("If-None-Match", ""), etag):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+
+    size = default_storage.size(name)
+    byte_range = _parse_range(request.headers.get("Range"), size)
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range.strip() != etag:
+        byte_range = None  # The client's copy is stale; send the whole file
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+    elif byte_range is None:
+        # FileResponse hands the file to the server's wsgi.file_wrapper (sendfile) when available
+        response = FileResponse(default_storage.open(name))
+        response["Content-Length"] = size
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _file_range(default_storage.open(name), start, end - start + 1), status=206)
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response["Content-Length"] = end - start + 1
+
+    for header, value in response_headers.items():
+        response[header] = value
+    if etag:
+        response["ETag"] = etag
+    return response
+
+
+def serve_protected_file(request, name, filename, etag=None, as_attachment=False,
+                         cache_control="private, max-age=0, must-revalidate"):
+    """
+    Response for an already-authorised file in default storage.
+
+    The content type comes from the stored ``name``, never the user-facing
+    ``filename``. Only INLINE_CONTENT_TYPES are served inline; everything else
+    is sent as an application/octet-stream attachment. Every response carries
+    ``Content-Security-Policy: sandbox``.
+
+    With ``PROTECTED_MEDIA_SERVER`` set to "nginx" (X-Accel-Redirect to the
+    internal ``PROTECTED_MEDIA_INTERNAL_URL`` location) or "apache"
+    (X-Sendfile), the web server sends the bytes itself, including ranges and
+    conditional requests. Otherwise Django streams the file.
+    """
+    content_type = _content_type(name)
+    if content_type is None:
+        content_type, as_attachment = "application/octet-stream", True
+    response_headers = {
+        "Content-Type": content_type,
+        "Content-Disposition": content_disposition_header(as_attachment, filename),
+        "Content-Security-Policy": "sandbox",
+        "X-Content-Type-Options": "nosniff",
+        "Accept-Ranges": "bytes",
+        "Cache-Control": cache_control,
+    }
+
+    server = settings.PROTECTED_MEDIA_SERVER
+    if server not in ("nginx", "apache"):
+        return _send_with_python(request, name, etag, response_headers)
+
+    response = HttpResponse()
+    for header, value in response_headers.items():
+        response[header] = value
+    if etag:
+        response["ETag"] = etag
+    if server == "nginx":
+        response["X-Accel-Redirect"] = settings.PROTECTED_MEDIA_INTERNAL_URL + quote(name)
+    else:
+        response["X-Sendfile"] = os.path.join(settings.MEDIA_ROOT, name)
+    return response
@@ -0,0 +1,99 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils.timezone import now
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# Delivery attempts before an email is dead-lettered, and the retry backoff
+# (RETRY_BASE_DELAY * 2 ** (attempts - 1), capped at RETRY_MAX_DELAY)
+MAX_ATTEMPTS = 6
+RETRY_BASE_DELAY = timedelta(minutes=1)
+RETRY_MAX_DELAY = timedelta(hours=1)
+BATCH_SIZE = 50
+
+
+def build_mail(subject, message, recipient_list, from_email=None):
+    """Unsaved outbox row, for callers that queue many emails with bulk_create."""
+    return OutboundEmail(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipient_list),
+    )
+
+
+def queue_mail(subject, message, recipient_list, from_email=None):
+    """
+    Queue an email for the send_queued_mail worker instead of sending it in the request.
+
+    Takes the same arguments as ``django.core.mail.send_mail``. The row is part of
+    the caller's transaction, so nothing is sent if it rolls back.
+    """
+    email = build_mail(subject, message, recipient_list, from_email)
+    email.save()
+    return email
+
+
+def retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+
+
+def due_emails(limit=BATCH_SIZE):
+    return list(
+        OutboundEmail.objects.filter(status="pending", next_attempt_at__lte=now())
+        .order_by("next_attempt_at", "id")[:limit]
+    )
+
+
+def deliver_queued_mail(limit=BATCH_SIZE):
+    """
+    Send one batch of due emails over a single SMTP connection.
+
+    Failed emails are rescheduled with exponential backoff and marked failed
+    (dead-lettered) after MAX_ATTEMPTS. Returns ``(sent, failed)`` counts.
+    """
+    emails = due_emails(limit)
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        for email in emails:
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.body,
+                from_email=email.from_email,
+                to=email.recipients,
+                connection=connection,
+            )
+            email.attempts += 1
+            try:
+                message.send()
+            except Exception as e:
+                failed += 1
+                email.last_error = f"{type(e).__name__}: {e}"
+                if email.attempts >= MAX_ATTEMPTS:
+                    email.status = "failed"
+                    logger.error(f"💀 Email {email.id} dead-lettered after {email.attempts} attempts: {e}")
+                else:
+                    email.next_attempt_at = now() + retry_delay(email.attempts)
+                    logger.warning(f"⚠️ Email {email.id} failed (attempt {email.attempts}), retrying: {e}")
+                # Drop a possibly broken connection; the next send reopens it
+                connection.close()
+            else:
+                sent += 1
+                email.status = "sent"
+                email.sent_at = now()
+                email.last_error = ""
+            email.save(update_fields=["status", "attempts", "next_attempt_at", "last_error", "sent_at"])
+    finally:
+        connection.close()
+
+    logger.info(f"📧 Outbox batch: {sent} sent, {failed} failed")
+    return sent, failed
@@ -0,0 +1,55 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from settlements_app.models import Blob, ChatMessage, Document
+
+
+class Command(BaseCommand):
+    help = (
+        "Move Document and ChatMessage files uploaded before content-addressed storage "
+        "into deduplicated blobs, deleting the original files once nothing references them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be moved without changing anything.")
+
+    def handle(self, *args, **options):
+        reclaimed = 0
+        for model in (Document, ChatMessage):
+            rows = model.objects.filter(blob__isnull=True).exclude(file="").exclude(file__isnull=True)
+            for row in rows.iterator(chunk_size=200):
+                reclaimed += self.move_to_blob(model, row, options["dry_run"])
+
+        action = "Would reclaim" if options["dry_run"] else "Reclaimed"
+        self.stdout.write(self.style.SUCCESS(f"{action} {reclaimed / (1024 * 1024):.1f} MB of duplicate media."))
+
+    def move_to_blob(self, model, row, dry_run):
+        old_name = row.file.name
+        if not default_storage.exists(old_name):
+            self.stderr.write(f"⚠️ {model._meta.label} {row.pk}: missing file {old_name}")
+            return 0
+
+        size = default_storage.size(old_name)
+        if dry_run:
+            self.stdout.write(f"📦 {model._meta.label} {row.pk}: {old_name}")
+            return 0
+
+        with transaction.atomic():
+            with default_storage.open(old_name) as file:
+                blob = Blob.objects.store(file)
+            updates = {"blob": blob, "file": blob.file.name}
+            if model is Document:
+                updates["sha256"] = blob.sha256
+            model.objects.filter(pk=row.pk).update(**updates)
+
+        # The old path may be shared by other rows (e.g. copied references); keep it until none remain
+        still_used = (
+            Document.objects.filter(file=old_name).exists()
+            or ChatMessage.objects.filter(file=old_name).exists()
+        )
+        if still_used or old_name == blob.file.name:
+            return 0
+        default_storage.delete(old_name)
+        self.stdout.write(f"✅ {model._meta.label} {row.pk}: {old_name} -> {blob.file.name}")
+        return size if blob.ref_count > 1 else 0
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from settlements_app.models import Blob
+from settlements_app.previews import generate_previews
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnails and text extracts for blobs that don't have them yet (e.g. after dedupe_media)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--regenerate", action="store_true", help="Also regenerate existing previews.")
+
+    def handle(self, *args, **options):
+        blobs = Blob.objects.all()
+        if options["regenerate"]:
+            blobs.update(previews_generated_at=None)
+        else:
+            blobs = blobs.filter(previews_generated_at__isnull=True)
+
+        count = 0
+        for blob_id in blobs.values_list("id", flat=True).iterator():
+            generate_previews(blob_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Generated previews for {count} blobs."))
@@ -0,0 +1,106 @@
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django_otp.plugins.otp_static.models import StaticDevice, StaticToken
+from django_otp.plugins.otp_totp.models import TOTPDevice
+
+from settlements_app.models import (
+    Blob,
+    ChatMessage,
+    ChatReadState,
+    Document,
+    Firm,
+    Instruction,
+    InstructionSearchDocument,
+    OutboundEmail,
+    Profile,
+    Solicitor,
+)
+
+# Copy order respects foreign keys; primary keys are preserved
+MODELS = [
+    User,
+    Profile,
+    Firm,
+    Solicitor,
+    Instruction,
+    InstructionSearchDocument,
+    Blob,  # Before Document and ChatMessage, which reference it (PROTECT)
+    Document,
+    ChatMessage,
+    ChatReadState,
+    OutboundEmail,  # Dead letters included: DeadLetterEmail is a proxy on the same table
+    TOTPDevice,
+    StaticDevice,
+    StaticToken,
+]
+
+
+@contextmanager
+def preserved_timestamps(model):
+    """Stop auto_now/auto_now_add fields from stamping copied rows with the time of the copy."""
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)]
+    flags = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in flags:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy users, firms, settlements, documents, chat, queued email and OTP devices from a SQLite "
+        "database alias into the default (PostgreSQL) database in bulk batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default="sqlite", help="Database alias to copy from (default: sqlite).")
+        parser.add_argument("--target", default="default", help="Database alias to copy into (default: default).")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        source, target, batch_size = options["source"], options["target"], options["batch_size"]
+        if source not in connections or target not in connections:
+            raise CommandError(f"Unknown database alias; configured aliases are {', '.join(connections)}.")
+        if source == target:
+            raise CommandError("Source and target databases must differ.")
+        if User.objects.using(target).exists():
+            raise CommandError(f"Target database '{target}' already contains users; migrate into an empty database.")
+
+        with transaction.atomic(using=target):
+            for model in MODELS:
+                with preserved_timestamps(model):
+                    copied = self.copy_model(model, source, target, batch_size)
+                self.stdout.write(f"📦 {model._meta.label}: {copied} rows")
+            self.reset_sequences(target)
+
+        self.stdout.write(self.style.SUCCESS(f"Copied data from '{source}' to '{target}'."))
+
+    def copy_model(self, model, source, target, batch_size):
+        copied, batch = 0, []
+        for obj in model.objects.using(source).order_by("pk").iterator(chunk_size=batch_size):
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                model.objects.using(target).bulk_create(batch)
+                copied += len(batch)
+                batch = []
+        if batch:
+            model.objects.using(target).bulk_create(batch)
+            copied += len(batch)
+        return copied
+
+    def reset_sequences(self, target):
+        """Move auto-increment sequences past the copied primary keys."""
+        connection = connections[target]
+        statements = connection.ops.sequence_reset_sql(no_style(), MODELS)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from settlements_app.models import Instruction
+from settlements_app.search import reindex_instruction
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search documents of every settlement instruction."
+
+    def handle(self, *args, **options):
+        count = 0
+        for instruction_id in Instruction.objects.values_list("id", flat=True).iterator(chunk_size=500):
+            reindex_instruction(instruction_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Reindexed {count} instructions."))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from settlements_app.mail import BATCH_SIZE, deliver_queued_mail
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued outbound emails in batches over a reused SMTP connection. "
+        "Runs continuously unless --once is given; run a single worker."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Deliver every email currently due, then exit.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = deliver_queued_mail(options["batch_size"])
+            if sent or failed:
+                self.stdout.write(f"📧 {sent} sent, {failed} failed")
+            if sent + failed >= options["batch_size"]:
+                continue  # A full batch; more may already be due
+            if options["once"]:
+                break
+            close_old_connections()
+            time.sleep(options["interval"])
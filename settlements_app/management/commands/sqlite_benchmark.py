@@ -0,0 +1,109 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# SQLite's defaults (rollback journal, full sync) versus the pragmas in settings.SQLITE_DATABASE
+DEFAULT_PROFILE = ("rollback journal (defaults)", [], None)
+
+
+def tuned_profile():
+    options = settings.SQLITE_DATABASE.get("OPTIONS", {})
+    pragmas = [command.strip() for command in options.get("init_command", "").split(";") if command.strip()]
+    return ("WAL + tuned pragmas", pragmas, options.get("transaction_mode"))
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark concurrent chat-style reads and writes on a scratch SQLite file with "
+        "SQLite's default settings and with the project's tuned pragmas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds per profile.")
+        parser.add_argument("--rows", type=int, default=20000, help="Rows seeded before each run.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"⏱ {options['readers']} readers / {options['writers']} writers, "
+            f"{options['duration']:.0f}s per profile, {options['rows']} seeded rows")
+        for name, pragmas, transaction_mode in (DEFAULT_PROFILE, tuned_profile()):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "benchmark.sqlite3")
+                result = self.run_profile(path, pragmas, transaction_mode, options)
+            self.stdout.write(
+                f"{name:<30} reads/s {result['reads'] / options['duration']:>9.0f}   "
+                f"writes/s {result['writes'] / options['duration']:>7.0f}   "
+                f"locked errors {result['errors']}")
+
+    def connect(self, path, pragmas):
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        for pragma in pragmas:
+            conn.execute(pragma)
+        return conn
+
+    def run_profile(self, path, pragmas, transaction_mode, options):
+        conn = self.connect(path, pragmas)
+        conn.execute(
+            "CREATE TABLE message (id INTEGER PRIMARY KEY, sender INTEGER, recipient INTEGER, "
+            "body TEXT, is_read INTEGER)")
+        conn.execute("CREATE INDEX message_recipient ON message (recipient, is_read)")
+        conn.executemany(
+            "INSERT INTO message (sender, recipient, body, is_read) VALUES (?, ?, ?, 1)",
+            ((n % 50, (n + 1) % 50, "x" * 200) for n in range(options["rows"])))
+        conn.close()
+
+        begin = f"BEGIN {transaction_mode}" if transaction_mode else "BEGIN"
+        counts = {"reads": 0, "writes": 0, "errors": 0}
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def reader(worker):
+            conn, done = self.connect(path, pragmas), 0
+            while not stop.is_set():
+                try:
+                    conn.execute(
+                        "SELECT id, body FROM message WHERE recipient = ? AND is_read = 0",
+                        (worker % 50,)).fetchall()
+                    done += 1
+                except sqlite3.OperationalError:
+                    with lock:
+                        counts["errors"] += 1
+            conn.close()
+            with lock:
+                counts["reads"] += done
+
+        def writer(worker):
+            conn, done = self.connect(path, pragmas), 0
+            while not stop.is_set():
+                try:
+                    conn.execute(begin)
+                    conn.execute(
+                        "INSERT INTO message (sender, recipient, body, is_read) VALUES (?, ?, ?, 0)",
+                        (worker, (worker + 1) % 50, "y" * 200))
+                    conn.execute("COMMIT")
+                    done += 1
+                except sqlite3.OperationalError:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    with lock:
+                        counts["errors"] += 1
+            conn.close()
+            with lock:
+                counts["writes"] += done
+
+        threads = [threading.Thread(target=reader, args=(n,)) for n in range(options["readers"])]
+        threads += [threading.Thread(target=writer, args=(n,)) for n in range(options["writers"])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options["duration"])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return counts
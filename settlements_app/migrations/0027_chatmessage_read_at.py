@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("settlements_app", "0026_profile"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatmessage",
+            name="read_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("settlements_app", "0027_chatmessage_read_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["sender", "timestamp"], name="chat_sender_ts_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["recipient", "timestamp"], name="chat_recipient_ts_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                condition=models.Q(("is_read", False)),
+                fields=["recipient", "sender"],
+                name="chat_unread_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("settlements_app", "0028_chatmessage_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="instruction",
+            name="firm",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="instructions",
+                to="settlements_app.firm",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="instruction",
+            index=models.Index(
+                fields=["firm", "-settlement_date"], name="instruction_firm_date_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_instruction_firm(apps, schema_editor):
+    Instruction = apps.get_model("settlements_app", "Instruction")
+    Solicitor = apps.get_model("settlements_app", "Solicitor")
+    Instruction.objects.update(
+        firm_id=Subquery(
+            Solicitor.objects.filter(pk=OuterRef("solicitor_id")).values("firm_id")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("settlements_app", "0029_instruction_firm"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_instruction_firm, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("settlements_app", "0030_backfill_instruction_firm"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="instruction",
+            name="instruction_firm_date_idx",
+        ),
+        migrations.AddIndex(
+            model_name="instruction",
+            index=models.Index(
+                fields=["firm", "-settlement_date", "-id"],
+                name="instruction_firm_date_idx",
+            ),
+        ),
+    ]
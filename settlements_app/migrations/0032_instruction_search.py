@@ -0,0 +1,131 @@
+# Generated by Django 5.1.7 on 2026-10-18 00:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+DOCUMENT_TABLE = "settlements_app_instructionsearchdocument"
+FTS_TABLE = "settlements_app_instruction_fts"
+
+SQLITE_FORWARD = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        body,
+        content='{DOCUMENT_TABLE}',
+        content_rowid='instruction_id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.instruction_id, new.body);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.instruction_id, old.body);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, body) VALUES ('delete', old.instruction_id, old.body);
+        INSERT INTO {FTS_TABLE}(rowid, body) VALUES (new.instruction_id, new.body);
+    END
+    """,
+]
+
+SQLITE_REVERSE = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRESQL_FORWARD = [
+    f"""
+    ALTER TABLE {DOCUMENT_TABLE} ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED
+    """,
+    f"CREATE INDEX instruction_search_vector_idx ON {DOCUMENT_TABLE} USING GIN (search_vector)",
+]
+
+POSTGRESQL_REVERSE = [
+    "DROP INDEX IF EXISTS instruction_search_vector_idx",
+    f"ALTER TABLE {DOCUMENT_TABLE} DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_FORWARD)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRESQL_FORWARD)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        _run(schema_editor, SQLITE_REVERSE)
+    elif vendor == "postgresql":
+        _run(schema_editor, POSTGRESQL_REVERSE)
+
+
+def backfill_search_documents(apps, schema_editor):
+    Instruction = apps.get_model("settlements_app", "Instruction")
+    Document = apps.get_model("settlements_app", "Document")
+    InstructionSearchDocument = apps.get_model("settlements_app", "InstructionSearchDocument")
+
+    document_names = {}
+    for instruction_id, name in Document.objects.values_list("instruction_id", "name").iterator():
+        document_names.setdefault(instruction_id, []).append(name)
+
+    batch = []
+    for instruction in Instruction.objects.iterator(chunk_size=2000):
+        parts = [
+            instruction.file_reference,
+            instruction.purchaser_name,
+            instruction.seller_name,
+            instruction.property_address,
+            instruction.title_reference,
+            *document_names.get(instruction.id, []),
+        ]
+        body = "\n".join(part for part in parts if part)
+        batch.append(InstructionSearchDocument(instruction_id=instruction.id, body=body))
+        if len(batch) >= 2000:
+            InstructionSearchDocument.objects.bulk_create(batch)
+            batch = []
+    InstructionSearchDocument.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("settlements_app", "0031_instruction_firm_date_id_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InstructionSearchDocument",
+            fields=[
+                (
+                    "instruction",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_document",
+                        serialize=False,
+                        to="settlements_app.instruction",
+                    ),
+                ),
+                ("body", models.TextField(blank=True, default="")),
+            ],
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("settlements_app", "0033_outboundemail"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="document",
+            name="sha256",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=64
+            ),
+        ),
+    ]
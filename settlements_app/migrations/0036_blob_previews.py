@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:09
+
+import settlements_app.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("settlements_app", "0035_content_addressed_blobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="blob",
+            name="previews_generated_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="blob",
+            name="text_extract",
+            field=models.TextField(blank=True, default=""),
+        ),
+        migrations.AddField(
+            model_name="blob",
+            name="thumbnail",
+            field=models.FileField(
+                blank=True,
+                max_length=255,
+                storage=settlements_app.storage.blob_storage,
+                upload_to="",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("settlements_app", "0036_blob_previews"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(fields=["-timestamp"], name="chat_timestamp_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="instruction",
+            index=models.Index(fields=["settlement_date"], name="instruction_date_idx"),
+        ),
+    ]
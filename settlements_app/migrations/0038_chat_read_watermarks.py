@@ -0,0 +1,78 @@
+# Generated by Django 5.1.7 on 2026-10-18 01:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Q, Subquery
+
+
+def backfill_read_watermarks(apps, schema_editor):
+    # Each side's watermark starts at the newest message it had read
+    User = apps.get_model("auth", "User")
+    ChatMessage = apps.get_model("settlements_app", "ChatMessage")
+    ChatReadState = apps.get_model("settlements_app", "ChatReadState")
+    read = ChatMessage.objects.filter(is_read=True).order_by("-id").values("id")
+    users = (
+        User.objects.filter(is_staff=False)
+        .annotate(
+            user_read=Subquery(read.filter(recipient=OuterRef("pk")).exclude(sender=OuterRef("pk"))[:1]),
+            staff_read=Subquery(read.filter(sender=OuterRef("pk"))[:1]),
+        )
+        .filter(Q(user_read__isnull=False) | Q(staff_read__isnull=False))
+    )
+    ChatReadState.objects.bulk_create(
+        ChatReadState(user_id=user.pk, user_read_up_to=user.user_read or 0, staff_read_up_to=user.staff_read or 0)
+        for user in users.iterator()
+    )
+
+
+def restore_read_flags(apps, schema_editor):
+    ChatMessage = apps.get_model("settlements_app", "ChatMessage")
+    ChatReadState = apps.get_model("settlements_app", "ChatReadState")
+    for state in ChatReadState.objects.iterator():
+        ChatMessage.objects.filter(
+            Q(recipient_id=state.user_id, id__lte=state.user_read_up_to)
+            | Q(sender_id=state.user_id, id__lte=state.staff_read_up_to)
+        ).update(is_read=True, read_at=state.updated_at)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("settlements_app", "0037_admin_date_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChatReadState",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="chat_read_state",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("user_read_up_to", models.PositiveBigIntegerField(default=0)),
+                ("staff_read_up_to", models.PositiveBigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_read_watermarks, restore_read_flags),
+        migrations.RemoveIndex(
+            model_name="chatmessage",
+            name="chat_unread_idx",
+        ),
+        migrations.RemoveField(
+            model_name="chatmessage",
+            name="is_read",
+        ),
+        migrations.RemoveField(
+            model_name="chatmessage",
+            name="read_at",
+        ),
+    ]
@@ -1,10 +1,16 @@
 import uuid
 import logging
+from functools import partial
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.utils.timezone import localtime
 import pytz
 
+from .storage import blob_name, blob_storage
+from .uploads import file_sha256
+
 # Set up logger
 logger = logging.getLogger(__name__)
 
@@ -46,6 +52,11 @@ class Solicitor(models.Model):
     def __str__(self):
         return f"{self.instructing_solicitor} ({self.firm.name if self.firm else 'No Firm'})"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Keep the denormalized Instruction.firm in step when a solicitor changes firm
+        self.instructions.exclude(firm_id=self.firm_id).update(firm_id=self.firm_id)
+
 # Instruction Model
 class Instruction(models.Model):
     SETTLEMENT_CHOICES = [
@@ -64,6 +75,8 @@ class Instruction(models.Model):
     ]
 
     solicitor = models.ForeignKey(Solicitor, on_delete=models.CASCADE, related_name="instructions")
+    # Denormalized from solicitor.firm so firm-wide listings avoid the join
+    firm = models.ForeignKey(Firm, on_delete=models.CASCADE, related_name="instructions", null=True, blank=True, editable=False)
     file_reference = models.CharField(max_length=50, unique=True, default=generate_file_reference)
     purchaser_name = models.CharField(max_length=255, blank=True, null=True)
     purchaser_email = models.EmailField(blank=True, null=True)
@@ -80,11 +93,23 @@ class Instruction(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     date_created = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Firm listing, keyset-paginated on (settlement_date, id)
+            models.Index(fields=["firm", "-settlement_date", "-id"], name="instruction_firm_date_idx"),
+            # Admin year filter bounds and settlement-date ordering across all firms
+            models.Index(fields=["settlement_date"], name="instruction_date_idx"),
+        ]
+
     def __str__(self):
         return f"{self.file_reference} - {self.get_status_display()}"
 
     def save(self, *args, **kwargs):
         logger.info(f"Saving Instruction: {self.file_reference}")
+        self.firm_id = self.solicitor.firm_id
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "solicitor" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "firm"}
         super().save(*args, **kwargs)
         logger.info(f"Instruction {self.file_reference} saved successfully.")
 
@@ -104,24 +129,124 @@ DOCUMENT_TYPE_CHOICES = [
     ('gst_withholding', 'GST Withholding'),
 ]
 
+class BlobManager(models.Manager):
+    def store(self, file):
+        """
+        Returns the blob holding ``file``'s content with one more reference,
+        writing the file to blob storage only if that content is new.
+        """
+        sha256 = file_sha256(file)
+        for _ in range(2):
+            try:
+                with transaction.atomic():
+                    if self.filter(sha256=sha256).update(ref_count=F("ref_count") + 1):
+                        return self.get(sha256=sha256)
+                    blob = self.model(sha256=sha256, size=file.size, ref_count=1)
+                    blob.file.save(blob_name(sha256, file.name), file, save=False)
+                    blob.save()
+                    return blob
+            except IntegrityError:
+                continue  # Stored concurrently by another request; take a reference to it
+        raise IntegrityError(f"Could not store blob {sha256}")
+
+    def release(self, blob_id):
+        """Drops one reference; the blob and its file are removed once nothing uses them."""
+        self.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F("ref_count") - 1)
+        orphan = self.filter(pk=blob_id, ref_count=0).first()
+        if orphan is None:
+            return
+        try:
+            deleted, _ = self.filter(pk=orphan.pk, ref_count=0).delete()
+        except models.ProtectedError:
+            logger.warning(f"⚠️ Blob {orphan.sha256} has no counted references but is still in use; kept")
+            return
+        if deleted:
+            for name in (orphan.file.name, orphan.thumbnail.name):
+                if name:
+                    transaction.on_commit(partial(orphan.file.storage.delete, name))
+
+# Content-addressed file shared by every Document/ChatMessage with the same content
+class Blob(models.Model):
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(storage=blob_storage, max_length=255)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Generated in the background by previews.generate_previews
+    thumbnail = models.FileField(storage=blob_storage, max_length=255, blank=True)
+    text_extract = models.TextField(blank=True, default="")
+    previews_generated_at = models.DateTimeField(blank=True, null=True)
+
+    objects = BlobManager()
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} refs)"
+
+def store_file_as_blob(instance, field_name="file"):
+    """
+    Points a new upload on ``instance.<field_name>`` at its deduplicated blob
+    (called from save() before the row is written). Returns the blob, or None
+    if there was no new upload.
+    """
+    field_file = getattr(instance, field_name)
+    if not field_file or field_file._committed:
+        return None
+    previous_blob_id = instance.blob_id
+    blob = Blob.objects.store(field_file.file)
+    instance.blob = blob
+    field_file.name = blob.file.name
+    field_file._committed = True
+    if previous_blob_id:
+        Blob.objects.release(previous_blob_id)
+    return blob
+
 class Document(models.Model):
     instruction = models.ForeignKey(Instruction, on_delete=models.CASCADE, related_name="documents")
     name = models.CharField(max_length=255)
     file = models.FileField(upload_to='settlements/documents/')
     document_type = models.CharField(max_length=50, choices=DOCUMENT_TYPE_CHOICES, default='contract')
+    sha256 = models.CharField(max_length=64, blank=True, default="", editable=False)  # Content hash of file
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name="documents")
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.name} - {self.instruction.file_reference}"
 
+    def save(self, *args, **kwargs):
+        blob = store_file_as_blob(self)
+        if blob is not None:
+            self.sha256 = blob.sha256
+        super().save(*args, **kwargs)
+
+class InstructionSearchDocument(models.Model):
+    """Searchable text of an instruction, indexed by SQLite FTS5 or a PostgreSQL tsvector (see search.py)."""
+    instruction = models.OneToOneField(Instruction, on_delete=models.CASCADE, primary_key=True, related_name="search_document")
+    body = models.TextField(blank=True, default="")
+
+    def __str__(self):
+        return f"Search document for {self.instruction_id}"
+
 class ChatMessage(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
     message = models.TextField(blank=True, null=True)  # Allow empty messages if file is present
     file = models.FileField(upload_to='chat_files/', blank=True, null=True)  # Added file field
-    is_read = models.BooleanField(default=False)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name="chat_messages")
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Chat sync: (sender OR recipient) within the history window, ordered by time
+            models.Index(fields=["sender", "timestamp"], name="chat_sender_ts_idx"),
+            models.Index(fields=["recipient", "timestamp"], name="chat_recipient_ts_idx"),
+            # Admin changelist: newest first over the whole table, and its year filter bounds
+            models.Index(fields=["-timestamp"], name="chat_timestamp_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        store_file_as_blob(self)
+        super().save(*args, **kwargs)
+
     def sender_name(self):
         """Return sender name or 'Settlex' for admin messages."""
         if self.sender.is_superuser:
@@ -136,9 +261,66 @@ class ChatMessage(models.Model):
     def __str__(self):
         return f"{self.sender_name()} -> {self.recipient.username}: {self.message[:50] if self.message else 'File'}"
 
+
+class ChatReadState(models.Model):
+    """
+    Read state of a user's conversation with staff as two watermarks: every
+    message with an id up to a watermark counts as read by that side. Reading
+    costs one row write per conversation, however many messages it covers.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="chat_read_state")
+    user_read_up_to = models.PositiveBigIntegerField(default=0)  # Staff messages the user has read
+    staff_read_up_to = models.PositiveBigIntegerField(default=0)  # User messages staff have read
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Chat read state for {self.user_id}"
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     two_factor_authenticated = models.BooleanField(default=False)
 
     def __str__(self):
-        return f'{self.user.username} Profile'
\ No newline at end of file
+        return f'{self.user.username} Profile'
+
+
+# Outbound email queue, delivered by `manage.py send_queued_mail` (see mail.py)
+class OutboundEmail(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Worker scan: due pending emails, oldest first
+            models.Index(
+                fields=["next_attempt_at", "id"],
+                condition=models.Q(status="pending"),
+                name="outbound_email_due_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.get_status_display()})"
+
+
+class DeadLetterEmail(OutboundEmail):
+    """Emails that exhausted their delivery attempts, listed separately in admin."""
+    class Meta:
+        proxy = True
+        verbose_name = "dead-letter email"
+        verbose_name_plural = "dead-letter emails"
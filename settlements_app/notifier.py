@@ -0,0 +1,198 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_notifiers = {}
+_notifiers_lock = threading.Lock()
+_park_slots = {}
+
+
+class BaseChatNotifier:
+    """
+    Wakes parked chat long-polls when something changes for a user.
+
+    ``publish(user_id)`` signals a change; ``listen(user_id)`` is a context
+    manager yielding a listener whose ``wait(timeout)`` returns True once a
+    change was published after the listener was opened. Open the listener
+    before reading the database so a change racing the read is not lost.
+    """
+
+    def publish(self, user_id):
+        raise NotImplementedError
+
+    def listen(self, user_id):
+        raise NotImplementedError
+
+
+class _LocalListener:
+    def __init__(self, notifier, user_id):
+        self.notifier = notifier
+        self.user_id = user_id
+        self.seen = notifier._sequence(user_id)
+
+    def wait(self, timeout):
+        with self.notifier._condition:
+            return self.notifier._condition.wait_for(
+                lambda: self.notifier._sequences.get(self.user_id, 0) != self.seen,
+                timeout=timeout)
+
+
+class LocalChatNotifier(BaseChatNotifier):
+    """In-process notifier built on a condition variable (single process only)."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._sequences = {}
+
+    def _sequence(self, user_id):
+        with self._condition:
+            return self._sequences.get(user_id, 0)
+
+    def publish(self, user_id):
+        with self._condition:
+            self._sequences[user_id] = self._sequences.get(user_id, 0) + 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def listen(self, user_id):
+        yield _LocalListener(self, user_id)
+
+
+class _RedisListener:
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+
+    def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            message = self.pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if message and message.get("type") == "message":
+                return True
+
+
+class RedisChatNotifier(BaseChatNotifier):
+    """Notifier using Redis pub/sub so wakeups reach every worker process."""
+
+    channel_prefix = "settlex:chat:"
+
+    def __init__(self, url=None):
+        import redis
+
+        self.client = redis.Redis.from_url(url or settings.REDIS_URL)
+
+    def _channel(self, user_id):
+        return f"{self.channel_prefix}{user_id}"
+
+    def publish(self, user_id):
+        self.client.publish(self._channel(user_id), "1")
+
+    @contextmanager
+    def listen(self, user_id):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self._channel(user_id))
+        try:
+            yield _RedisListener(pubsub)
+        finally:
+            pubsub.close()
+
+
+def server_processes():
+    """
+    Worker processes serving the app: uWSGI's own count when running under
+    it, otherwise ``WEB_CONCURRENCY`` (gunicorn and most PaaS), default 1.
+    """
+    try:
+        import uwsgi
+    except ImportError:
+        return int(os.environ.get("WEB_CONCURRENCY", 1))
+    return uwsgi.numproc
+
+
+def check_notifier_backend():
+    """
+    Refuse to start LocalChatNotifier under several worker processes: its
+    wakeups never leave the process, so polls parked in another worker would
+    sleep out their whole timeout.
+    """
+    processes = server_processes()
+    if processes > 1 and issubclass(import_string(settings.CHAT_NOTIFIER_BACKEND), LocalChatNotifier):
+        raise ImproperlyConfigured(
+            f"{settings.CHAT_NOTIFIER_BACKEND} only works in a single process, but {processes} are "
+            "running. Set REDIS_URL (RedisChatNotifier) or run one process.")
+
+
+def get_notifier():
+    """Return the notifier configured by ``CHAT_NOTIFIER_BACKEND``."""
+    backend = settings.CHAT_NOTIFIER_BACKEND
+    notifier = _notifiers.get(backend)
+    if notifier is None:
+        with _notifiers_lock:
+            notifier = _notifiers.get(backend)
+            if notifier is None:
+                notifier = _notifiers[backend] = import_string(backend)()
+    return notifier
+
+
+@contextmanager
+def park_slot():
+    """
+    Reserve one of this process's ``CHAT_LONG_POLL_MAX_PARKED`` slots for a
+    parked long-poll without blocking; yields False when all are taken. Each
+    parked poll holds a server thread, so the cap keeps threads free for pages.
+    """
+    limit = settings.CHAT_LONG_POLL_MAX_PARKED
+    semaphore = _park_slots.get(limit)
+    if semaphore is None:
+        with _notifiers_lock:
+            semaphore = _park_slots.setdefault(limit, threading.BoundedSemaphore(limit))
+    acquired = semaphore.acquire(blocking=False)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            semaphore.release()
+
+
+# Channel layer group joined by each user's WebSocket chat consumers.
+def chat_group_name(user_id):
+    return f"chat_user_{user_id}"
+
+
+def broadcast_to_websockets(user_ids, event):
+    """Send a channel layer ``event`` to the WebSocket chat consumers of ``user_ids``."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for user_id in user_ids:
+        async_to_sync(channel_layer.group_send)(chat_group_name(user_id), event)
+
+
+def notify_users(*user_ids):
+    """Wake the chat long-polls and WebSockets of ``user_ids`` once the current transaction commits."""
+    def _publish():
+        notifier = get_notifier()
+        for user_id in set(user_ids):
+            try:
+                notifier.publish(user_id)
+            except Exception:
+                logger.exception("❌ Failed to publish chat wakeup for user %s", user_id)
+        try:
+            broadcast_to_websockets(set(user_ids), {"type": "chat.wakeup"})
+        except Exception:
+            logger.exception("❌ Failed to push chat wakeup to WebSocket consumers")
+
+    transaction.on_commit(_publish)
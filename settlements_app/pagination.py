@@ -0,0 +1,124 @@
+import base64
+import binascii
+from datetime import date
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connection, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Page size bounds for the My Settlements listing.
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+
+def parse_page_size(value):
+    """Clamp a requested page size to ``1..MAX_PAGE_SIZE``."""
+    try:
+        return min(max(int(value), 1), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+
+
+def encode_cursor(instruction):
+    """Encode the (settlement_date, id) position after ``instruction`` as an opaque token."""
+    settlement_date = instruction.settlement_date.isoformat() if instruction.settlement_date else ""
+    raw = f"{settlement_date}|{instruction.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Decode a cursor from ``encode_cursor``; returns None for a missing or malformed token."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        settlement_date, instruction_id = raw.split("|")
+        return (date.fromisoformat(settlement_date) if settlement_date else None, int(instruction_id))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def _after_cursor(settlement_date, instruction_id):
+    """
+    Rows that sort after the cursor in ``-settlement_date, -id`` order.
+
+    NULL dates sort first on backends where NULL is the largest value
+    (PostgreSQL) and last where it is the smallest (SQLite, MySQL).
+    """
+    nulls_first = connection.features.nulls_order_largest
+    if settlement_date is None:
+        after = Q(settlement_date__isnull=True, id__lt=instruction_id)
+        if nulls_first:
+            after |= Q(settlement_date__isnull=False)
+        return after
+
+    after = Q(settlement_date__lt=settlement_date) | Q(settlement_date=settlement_date, id__lt=instruction_id)
+    if not nulls_first:
+        after |= Q(settlement_date__isnull=True)
+    return after
+
+
+def keyset_page(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return ``(instructions, next_cursor)`` for one page of a settlement listing.
+
+    Pages are ordered by ``-settlement_date, -id`` and addressed by the
+    position of their last row rather than an offset, so every page is an
+    index range scan and no COUNT is needed. ``next_cursor`` is None on the
+    last page.
+    """
+    queryset = queryset.order_by("-settlement_date", "-id")
+    position = decode_cursor(cursor)
+    if position is not None:
+        queryset = queryset.filter(_after_cursor(*position))
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+    return rows[:page_size], next_cursor
+
+
+def estimated_row_count(model, using="default"):
+    """
+    The planner's row estimate for ``model``'s table, or None if the backend
+    keeps none: ``pg_class.reltuples`` on PostgreSQL, ``sqlite_stat1`` on SQLite
+    (filled by ANALYZE / PRAGMA optimize; see sqlite_maintenance).
+    """
+    db = connections[using]
+    table = model._meta.db_table
+    with db.cursor() as cursor:
+        if db.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", [table])
+            row = cursor.fetchone()
+            # reltuples is -1 until the table is first analyzed
+            return row[0] if row and row[0] >= 0 else None
+        if db.vendor == "sqlite":
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+            # The first number of each index's stat is the row count it was analyzed with
+            counts = [int(stat.split()[0]) for (stat,) in cursor.fetchall() if stat]
+            return max(counts) if counts else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for large admin changelists. An unfiltered queryset over a table
+    the planner puts above ``ADMIN_ESTIMATED_COUNT_THRESHOLD`` rows is counted
+    from the statistics instead of with COUNT(*); anything else is counted exactly.
+
+    Use with ``show_full_result_count = False``, which drops the admin's second,
+    unfiltered COUNT(*).
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is not None and not query.where:
+            estimate = estimated_row_count(self.object_list.model, self.object_list.db)
+            if estimate is not None and estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
@@ -0,0 +1,86 @@
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from django.utils.timezone import now
+from PIL import Image
+
+from .models import Blob
+from .storage import thumbnail_name
+
+try:  # Optional: first-page rendering and text extraction for PDFs
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = (320, 320)
+TEXT_EXTRACT_LENGTH = 2000
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tif", ".tiff", ".webp"}
+TEXT_EXTENSIONS = {".txt", ".csv"}
+
+
+def _pdf_preview(file):
+    if pdfium is None:
+        return None, ""
+    pdf = pdfium.PdfDocument(file.read())
+    try:
+        page = pdf[0]
+        image = page.render(scale=1).to_pil()
+        text = page.get_textpage().get_text_range()[:TEXT_EXTRACT_LENGTH]
+        return image, text
+    finally:
+        pdf.close()
+
+
+def _image_preview(file):
+    image = Image.open(file)
+    image.load()
+    return image, ""
+
+
+def _text_preview(file):
+    return None, file.read(TEXT_EXTRACT_LENGTH * 4).decode("utf-8", errors="replace")[:TEXT_EXTRACT_LENGTH]
+
+
+def render_preview(file, extension):
+    """``(thumbnail PIL image or None, text extract)`` for an open file."""
+    if extension == ".pdf":
+        return _pdf_preview(file)
+    if extension in IMAGE_EXTENSIONS:
+        return _image_preview(file)
+    if extension in TEXT_EXTENSIONS:
+        return _text_preview(file)
+    return None, ""
+
+
+def generate_previews(blob_id):
+    """
+    Creates the first-page thumbnail and text extract of a blob (shared by every
+    document with the same content). Runs in the background; see tasks.py.
+    """
+    blob = Blob.objects.filter(pk=blob_id, previews_generated_at__isnull=True).first()
+    if blob is None:
+        return
+
+    extension = os.path.splitext(blob.file.name)[1].lower()
+    image, text = None, ""
+    try:
+        with blob.file.open("rb") as file:
+            image, text = render_preview(file, extension)
+    except Exception as e:
+        # Damaged or unsupported files simply get no preview
+        logger.warning(f"⚠️ Could not render preview for blob {blob.sha256}: {e}")
+
+    if image is not None:
+        image.thumbnail(THUMBNAIL_SIZE)
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="PNG", optimize=True)
+        blob.thumbnail.save(thumbnail_name(blob.sha256), ContentFile(buffer.getvalue()), save=False)
+
+    blob.text_extract = text.strip()
+    blob.previews_generated_at = now()
+    blob.save(update_fields=["thumbnail", "text_extract", "previews_generated_at"])
+    logger.info(f"🖼 Previews generated for blob {blob.sha256} (thumbnail: {image is not None})")
@@ -0,0 +1,97 @@
+import logging
+import re
+
+from django.db import connection, transaction
+
+from .models import Instruction, InstructionSearchDocument
+
+logger = logging.getLogger(__name__)
+
+# Full-text structures created by migration 0032 for each backend.
+SQLITE_FTS_TABLE = "settlements_app_instruction_fts"
+SEARCH_DOCUMENT_TABLE = InstructionSearchDocument._meta.db_table
+
+MAX_SEARCH_TERMS = 8
+
+
+def build_search_body(instruction, document_names=()):
+    """Concatenate the searchable text of an instruction and its documents."""
+    parts = [
+        instruction.file_reference,
+        instruction.purchaser_name,
+        instruction.seller_name,
+        instruction.property_address,
+        instruction.title_reference,
+        *document_names,
+    ]
+    return "\n".join(part for part in parts if part)
+
+
+def reindex_instruction(instruction_id):
+    """Rebuild the search document of one instruction (no-op if it has been deleted)."""
+    instruction = Instruction.objects.filter(pk=instruction_id).first()
+    if instruction is None:
+        return
+    document_names = instruction.documents.values_list("name", flat=True)
+    InstructionSearchDocument.objects.update_or_create(
+        instruction=instruction,
+        defaults={"body": build_search_body(instruction, document_names)},
+    )
+
+
+def schedule_reindex(instruction_id):
+    """Reindex an instruction once the current transaction commits."""
+    transaction.on_commit(lambda: reindex_instruction(instruction_id))
+
+
+def _search_terms(query):
+    return re.findall(r"\w+", query.lower())[:MAX_SEARCH_TERMS]
+
+
+def _search_ids(firm_id, terms, limit):
+    instruction_table = Instruction._meta.db_table
+
+    if connection.vendor == "sqlite":
+        match = " ".join(f'"{term}"*' for term in terms)
+        sql = (
+            f"SELECT i.id FROM {SQLITE_FTS_TABLE} "
+            f"JOIN {instruction_table} i ON i.id = {SQLITE_FTS_TABLE}.rowid "
+            f"WHERE {SQLITE_FTS_TABLE} MATCH %s AND i.firm_id = %s "
+            f"ORDER BY {SQLITE_FTS_TABLE}.rank LIMIT %s"
+        )
+        params = [match, firm_id, limit]
+
+    elif connection.vendor == "postgresql":
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        sql = (
+            f"SELECT i.id FROM {SEARCH_DOCUMENT_TABLE} d "
+            f"JOIN {instruction_table} i ON i.id = d.instruction_id "
+            f"WHERE d.search_vector @@ to_tsquery('simple', %s) AND i.firm_id = %s "
+            f"ORDER BY ts_rank(d.search_vector, to_tsquery('simple', %s)) DESC LIMIT %s"
+        )
+        params = [tsquery, firm_id, tsquery, limit]
+
+    else:
+        documents = InstructionSearchDocument.objects.filter(instruction__firm_id=firm_id)
+        for term in terms:
+            documents = documents.filter(body__icontains=term)
+        return list(documents.values_list("instruction_id", flat=True)[:limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_instructions(firm_id, query, limit=20):
+    """
+    Return the firm's instructions matching ``query``, best match first.
+
+    Every word of the query must match the start of a word in the file
+    reference, parties, property address, title references or document names.
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return []
+    ids = _search_ids(firm_id, terms, limit)
+    instructions = Instruction.objects.in_bulk(ids)
+    return [instructions[pk] for pk in ids if pk in instructions]
@@ -1,7 +1,17 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
+from django.core.cache import cache
+from django.db import transaction
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Profile
+from django_otp.plugins.otp_static.models import StaticDevice
+from django_otp.plugins.otp_totp.models import TOTPDevice
+from .context_processors import latest_instruction_cache_key
+from .devices import invalidate_default_device
+from .documents import post_process_document
+from .models import Profile, ChatMessage, Instruction, Document, Blob
+from .notifier import notify_users
+from .search import schedule_reindex
+from .tasks import run_in_background
 
 @receiver(post_save, sender=User)
 def create_or_save_profile(sender, instance, created, **kwargs):
@@ -19,3 +29,71 @@ def create_or_save_profile(sender, instance, created, **kwargs):
             # In case the profile doesn't exist, create it
             Profile.objects.create(user=instance)
 
+
+@receiver(post_save, sender=ChatMessage)
+def wake_chat_participants(sender, instance, **kwargs):
+    """
+    Wakes the long-polls of both participants whenever a chat message is created or updated.
+    """
+    notify_users(instance.sender_id, instance.recipient_id)
+
+
+@receiver(post_save, sender=Instruction)
+def reindex_saved_instruction(sender, instance, raw=False, **kwargs):
+    """
+    Keeps the instruction's full-text search document current.
+    """
+    if not raw:
+        schedule_reindex(instance.pk)
+
+
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def reindex_document_instruction(sender, instance, raw=False, **kwargs):
+    """
+    Document names are searchable, so reindex the owning instruction when they change.
+    """
+    if not raw:
+        schedule_reindex(instance.instruction_id)
+
+
+@receiver(post_save, sender=Instruction)
+@receiver(post_delete, sender=Instruction)
+def invalidate_latest_instruction(sender, instance, **kwargs):
+    """
+    Drops the cached latest instruction of the owning solicitor's user once the change commits.
+    """
+    key = latest_instruction_cache_key(instance.solicitor.user_id)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+@receiver(post_save, sender=TOTPDevice)
+@receiver(post_delete, sender=TOTPDevice)
+@receiver(post_save, sender=StaticDevice)
+@receiver(post_delete, sender=StaticDevice)
+def invalidate_default_device_flag(sender, instance, **kwargs):
+    """
+    Drops the cached 2FA gate flag when a user's OTP devices are created, confirmed, renamed or deleted.
+    """
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_default_device(user_id))
+
+
+@receiver(post_delete, sender=Document)
+@receiver(post_delete, sender=ChatMessage)
+def release_file_blob(sender, instance, **kwargs):
+    """
+    Drops the deleted row's reference to its file blob, removing the file once no row uses it.
+    """
+    if instance.blob_id:
+        Blob.objects.release(instance.blob_id)
+
+
+@receiver(post_save, sender=Document)
+def post_process_new_document(sender, instance, created, raw=False, **kwargs):
+    """
+    Queues previews and the scan hook for a new document, off the request path
+    (bulk uploads queue the same work themselves; see documents.py).
+    """
+    if created and not raw:
+        run_in_background(post_process_document, instance.pk)
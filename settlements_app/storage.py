@@ -0,0 +1,49 @@
+import os
+import threading
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage for blobs named by their SHA-256 (see ``Blob.objects.store``).
+
+    A name already on disk holds identical content, so saving it again keeps
+    the existing file instead of writing a suffixed copy.
+    """
+
+    # Name being written by this thread's _save (see get_available_name)
+    _saving = threading.local()
+
+    def get_available_name(self, name, max_length=None):
+        if getattr(self._saving, "name", None) == name:
+            # FileSystemStorage._save lost the race to create this name and asks
+            # for another; there is none, so stop its retry loop instead.
+            raise FileExistsError(name)
+        return name
+
+    def _save(self, name, content):
+        if self.exists(name):
+            return name
+        self._saving.name = name
+        try:
+            return super()._save(name, content)
+        except FileExistsError:
+            if not self.exists(name):
+                raise
+            return name  # Another request stored the same content first
+        finally:
+            self._saving.name = None
+
+def blob_name(sha256, original_name=""):
+    """``blobs/ab/cd/<sha256><ext>``, keeping the original extension for content types."""
+    extension = os.path.splitext(original_name)[1].lower()[:10]
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+def thumbnail_name(sha256):
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}.thumb.png"
+
+
+def blob_storage():
+    return ContentAddressedStorage()
@@ -0,0 +1,41 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BACKGROUND_TASK_WORKERS, thread_name_prefix="settlex-task")
+    return _executor
+
+
+def _run(func, args):
+    close_old_connections()
+    try:
+        func(*args)
+    except Exception:
+        logger.exception(f"❌ Background task {func.__name__}{args} failed")
+    finally:
+        close_old_connections()
+
+
+def run_in_background(func, *args):
+    """
+    Run ``func(*args)`` on the in-process worker pool once the current
+    transaction commits, keeping slow work (previews, scans) off the request path.
+
+    With ``BACKGROUND_TASKS_EAGER`` the task runs inline at commit instead (tests).
+    """
+    if settings.BACKGROUND_TASKS_EAGER:
+        transaction.on_commit(lambda: func(*args))
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_run, func, args))
+
@@ -1,13 +1,23 @@
-from django.test import SimpleTestCase, TestCase, RequestFactory
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.urls import reverse, resolve
 from django.contrib.sessions.backends.db import SessionStore
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
 from collections import OrderedDict
+from io import StringIO
 from types import SimpleNamespace
 
 from django_otp.plugins.otp_totp.models import TOTPDevice
 
 
+from datetime import date
+
+from .context_processors import latest_instruction
+from .models import Document, Firm, Instruction, Solicitor
+from .pagination import decode_cursor, keyset_page
+from .search import search_instructions
 from .views import view_settlement, SettlexTwoFactorSetupView
 from .forms import CustomTOTPDeviceForm, WelcomeStepForm
 
@@ -22,3 +32,185 @@ class URLTests(SimpleTestCase):
         resolver = resolve('/settlement/1/')
         self.assertEqual(resolver.func, view_settlement)
 
+
+class HealthCheckTests(TestCase):
+    """Tests for the load balancer health endpoint."""
+
+    def test_reports_database_vendor(self):
+        response = self.client.get(reverse('settlements_app:health_check'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'success', 'database': connection.vendor})
+
+
+class SqliteMaintenanceCommandTests(TransactionTestCase):
+    """Tests for the sqlite_maintenance management command."""
+
+    def test_runs_optimize_and_checkpoint(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only.')
+        out = StringIO()
+        call_command('sqlite_maintenance', '--checkpoint', 'PASSIVE', stdout=out)
+        self.assertIn('wal_checkpoint(PASSIVE)', out.getvalue())
+
+
+class InstructionFirmTests(TestCase):
+    """Tests for the denormalized Instruction.firm column."""
+
+    def setUp(self):
+        self.firm = Firm.objects.create(name='Alpha Legal', contact_email='alpha@example.com')
+        self.other_firm = Firm.objects.create(name='Beta Legal', contact_email='beta@example.com')
+        user = User.objects.create_user(username='solicitor')
+        self.solicitor = Solicitor.objects.create(user=user, instructing_solicitor='Sam Solicitor', firm=self.firm)
+
+    def test_firm_is_copied_from_solicitor_on_save(self):
+        instruction = Instruction.objects.create(solicitor=self.solicitor, title_reference='123/456')
+        self.assertEqual(instruction.firm, self.firm)
+
+    def test_firm_follows_solicitor_changing_firm(self):
+        instruction = Instruction.objects.create(solicitor=self.solicitor, title_reference='123/456')
+        self.solicitor.firm = self.other_firm
+        self.solicitor.save()
+        instruction.refresh_from_db()
+        self.assertEqual(instruction.firm, self.other_firm)
+
+
+class KeysetPaginationTests(TestCase):
+    """Tests for the keyset-paginated My Settlements listing."""
+
+    def setUp(self):
+        firm = Firm.objects.create(name='Alpha Legal', contact_email='alpha@example.com')
+        user = User.objects.create_user(username='solicitor')
+        solicitor = Solicitor.objects.create(user=user, instructing_solicitor='Sam Solicitor', firm=firm)
+        dates = [date(2025, 1, 3), date(2025, 1, 3), None, date(2025, 2, 1), None, date(2024, 12, 1), date(2025, 1, 3)]
+        for index, settlement_date in enumerate(dates):
+            Instruction.objects.create(
+                solicitor=solicitor, title_reference=f'{index}/1', settlement_date=settlement_date)
+        self.queryset = Instruction.objects.filter(firm=firm)
+
+    def test_pages_cover_listing_without_gaps_or_duplicates(self):
+        expected = list(self.queryset.order_by('-settlement_date', '-id').values_list('id', flat=True))
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page, cursor = keyset_page(self.queryset, cursor, page_size=3)
+            seen.extend(instruction.id for instruction in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_malformed_cursor_starts_from_first_page(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        page, _ = keyset_page(self.queryset, 'not-a-cursor', page_size=2)
+        self.assertEqual(len(page), 2)
+
+
+class SettlementSearchTests(TestCase):
+    """Tests for the firm-scoped full-text settlement search."""
+
+    def setUp(self):
+        firm = Firm.objects.create(name='Alpha Legal', contact_email='alpha@example.com')
+        other_firm = Firm.objects.create(name='Beta Legal', contact_email='beta@example.com')
+        solicitor = Solicitor.objects.create(
+            user=User.objects.create_user(username='solicitor'), instructing_solicitor='Sam Solicitor', firm=firm)
+        other_solicitor = Solicitor.objects.create(
+            user=User.objects.create_user(username='other'), instructing_solicitor='Olive Other', firm=other_firm)
+        self.firm_id = firm.id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.instruction = Instruction.objects.create(
+                solicitor=solicitor, title_reference='50123/456', purchaser_name='Margaret Whitfield',
+                property_address='12 Harbour Street, Brisbane')
+            Instruction.objects.create(
+                solicitor=other_solicitor, title_reference='777/888', purchaser_name='Margaret Whitfield')
+            Document.objects.create(
+                instruction=self.instruction, name='Kensington contract.pdf', file='settlements/documents/c.pdf')
+
+    def test_matches_parties_address_and_documents(self):
+        for query in ('whitfield', 'Harbour Brisbane', 'kensington', '50123'):
+            self.assertEqual(search_instructions(self.firm_id, query), [self.instruction], query)
+
+    def test_matches_word_prefixes(self):
+        self.assertEqual(search_instructions(self.firm_id, 'Whit harb'), [self.instruction])
+
+    def test_results_are_scoped_to_firm(self):
+        self.assertEqual(len(search_instructions(self.firm_id, 'margaret')), 1)
+
+    def test_deleted_document_is_no_longer_searchable(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.instruction.documents.all().delete()
+        self.assertEqual(search_instructions(self.firm_id, 'kensington'), [])
+
+    def test_blank_or_punctuation_query_returns_nothing(self):
+        self.assertEqual(search_instructions(self.firm_id, '  "*" '), [])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LatestInstructionContextTests(TestCase):
+    """Tests for the cached, lazy latest_instruction context processor."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='solicitor')
+        self.solicitor = Solicitor.objects.create(user=self.user, instructing_solicitor='Sam Solicitor')
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_unused_value_runs_no_query(self):
+        with self.assertNumQueries(0):
+            latest_instruction(self.request)
+
+    def test_value_is_cached_until_an_instruction_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Instruction.objects.create(solicitor=self.solicitor, title_reference='1/1')
+        with self.assertNumQueries(1):
+            self.assertEqual(latest_instruction(self.request)['latest_instruction'].id, first.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(latest_instruction(self.request)['latest_instruction'].id, first.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second = Instruction.objects.create(solicitor=self.solicitor, title_reference='2/2')
+        self.assertEqual(latest_instruction(self.request)['latest_instruction'].id, second.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(latest_instruction(self.request)['latest_instruction'].id, first.id)
+
+    def test_user_without_instructions_gets_falsy_value(self):
+        self.assertFalse(latest_instruction(self.request)['latest_instruction'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ViewSettlementQueryTests(TestCase):
+    """The settlement detail page runs a fixed number of queries however many documents it lists."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='solicitor')
+        firm = Firm.objects.create(name='Alpha Legal', contact_email='alpha@example.com')
+        solicitor = Solicitor.objects.create(user=self.user, instructing_solicitor='Sam Solicitor', firm=firm)
+        self.instruction = Instruction.objects.create(solicitor=solicitor, title_reference='123/456')
+
+    def _get(self):
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(pk=self.user.pk)
+        # Solicitor with firm, instruction, documents with blobs, sidebar's latest instruction
+        with self.assertNumQueries(4):
+            response = view_settlement(request, self.instruction.id)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_does_not_grow_with_documents(self):
+        self._get()
+        Document.objects.bulk_create(
+            Document(instruction=self.instruction, name=f'Doc {n}', file=f'settlements/documents/{n}.pdf')
+            for n in range(5))
+        cache.clear()
+        response = self._get()
+        self.assertContains(response, 'Doc 4')
+        self.assertContains(response, 'Alpha Legal')
+
+    def test_anonymous_users_are_sent_to_login(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        response = view_settlement(request, self.instruction.id)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(reverse('settlements_app:login')))
@@ -0,0 +1,190 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+
+from .chat import conversation_summaries, peer_is_typing, set_typing
+from .models import ChatMessage, ChatReadState, Firm, Instruction, Solicitor
+from .pagination import EstimatedCountPaginator
+
+
+class AdminChangelistQueryTests(TestCase):
+    """Changelist pages run the same number of queries for 2 rows as for 20."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='settlex', password='pass', email='a@example.com')
+        self.client.login(username='settlex', password='pass')
+        self.added = 0
+        self.solicitor = self.add_solicitor()
+
+    def add_solicitor(self):
+        n = self.added = self.added + 1
+        firm = Firm.objects.create(name=f'Firm {n}', contact_email=f'firm{n}@example.com')
+        user = User.objects.create_user(username=f'solicitor{n}', first_name='Sam', last_name=f'Solicitor {n}')
+        return Solicitor.objects.create(user=user, instructing_solicitor=f'Sam Solicitor {n}', firm=firm)
+
+    def add_rows(self, count):
+        # New solicitors (and firms) each time, plus rows that point at them
+        for _ in range(count):
+            solicitor = self.add_solicitor()
+            Instruction.objects.create(solicitor=solicitor, title_reference=f'{self.added}/1')
+            ChatMessage.objects.create(sender=solicitor.user, recipient=self.admin, message=f'Question {self.added}')
+            ChatMessage.objects.create(sender=self.admin, recipient=solicitor.user, message=None)
+
+    def count_queries(self, model_name, **params):
+        url = reverse(f'admin:settlements_app_{model_name}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def assert_constant_queries(self, model_name, **params):
+        self.add_rows(2)
+        few, _ = self.count_queries(model_name, **params)
+        self.add_rows(18)
+        many, response = self.count_queries(model_name, **params)
+        self.assertEqual(many, few)
+        return response
+
+    def test_instruction_changelist(self):
+        response = self.assert_constant_queries('instruction')
+        self.assertContains(response, 'Sam Solicitor 21 (Firm 21)')
+
+    def test_solicitor_filter_searches_instead_of_listing(self):
+        self.add_rows(2)
+        response = self.client.get(reverse('admin:settlements_app_instruction_changelist'),
+                                   {'solicitor__id__exact': self.solicitor.pk + 1})
+        self.assertContains(response, 'data-autocomplete-filter="solicitor__id__exact"')
+        self.assertContains(response, '1 instruction')
+        self.assertContains(response, '<option value="2" selected>Sam Solicitor 2 (Firm 2)</option>', html=True)
+        self.assertNotContains(response, 'Sam Solicitor 3')
+
+        response = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'settlements_app', 'model_name': 'instruction', 'field_name': 'solicitor', 'term': 'Firm 3'})
+        self.assertEqual([result['text'] for result in response.json()['results']], ['Sam Solicitor 3 (Firm 3)'])
+
+    def test_solicitor_changelist_sorted_by_firm(self):
+        # Column 2 is the firm name (sorted through firm__name)
+        response = self.assert_constant_queries('solicitor', o='2')
+        self.assertContains(response, 'Firm 20')
+
+    def test_chatmessage_changelist_sorted_by_sender(self):
+        response = self.assert_constant_queries('chatmessage', o='1')
+        self.assertContains(response, 'Sam Solicitor 20')
+        self.assertContains(response, 'Settlex (Admin)')
+
+    def test_year_navigation_skips_the_distinct_date_scan(self):
+        self.add_rows(2)
+        old = ChatMessage.objects.earliest('id')
+        ChatMessage.objects.filter(pk=old.pk).update(timestamp=old.timestamp.replace(year=2019))
+        count, response = self.count_queries('chatmessage')
+        self.assertContains(response, '?timestamp__year=2019')
+        self.assertContains(response, f'?timestamp__year={now().year}')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:settlements_app_chatmessage_changelist'), {'timestamp__year': 2019})
+        self.assertContains(response, '1 chat message')
+        self.assertFalse([q['sql'] for q in queries if 'DISTINCT' in q['sql']])
+
+        _, response = self.count_queries('instruction')
+        self.assertNotContains(response, 'settlement_date__year=')  # No dates set: nothing to navigate
+        Instruction.objects.filter(pk=Instruction.objects.earliest('id').pk).update(settlement_date='2024-06-30')
+        _, response = self.count_queries('instruction', settlement_date__year=2024)
+        self.assertContains(response, '?settlement_date__year=2024')
+        self.assertContains(response, '1 instruction')
+
+
+@override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=10)
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='solicitor')
+        self.admin = User.objects.create_superuser(username='settlex', email='a@example.com')
+        ChatMessage.objects.bulk_create(
+            ChatMessage(sender=self.user, recipient=self.admin, message=f'{n}') for n in range(12))
+
+    def test_count_comes_from_statistics_above_threshold(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        ChatMessage.objects.create(sender=self.admin, recipient=self.user, message='reply')
+
+        # Unfiltered: the (now stale) estimate from ANALYZE, without COUNT(*)
+        self.assertEqual(EstimatedCountPaginator(ChatMessage.objects.order_by('id'), 10).count, 12)
+        # Filtered: an exact count
+        self.assertEqual(EstimatedCountPaginator(ChatMessage.objects.filter(sender=self.admin).order_by('id'), 10).count, 1)
+
+    def test_exact_count_without_statistics_or_below_threshold(self):
+        self.assertEqual(EstimatedCountPaginator(ChatMessage.objects.order_by('id'), 10).count, 12)
+        with override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            ChatMessage.objects.create(sender=self.admin, recipient=self.user, message='reply')
+            self.assertEqual(EstimatedCountPaginator(ChatMessage.objects.order_by('id'), 10).count, 13)
+
+
+class ChatInboxTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='settlex', password='pass', email='a@example.com')
+        self.alice = User.objects.create_user(username='alice', first_name='Alice', last_name='Adams')
+        self.bob = User.objects.create_user(username='bob')
+        for text in ('first', 'second'):
+            ChatMessage.objects.create(sender=self.alice, recipient=self.admin, message=text)
+        ChatMessage.objects.create(sender=self.admin, recipient=self.alice, message='On it')
+        self.bob_message = ChatMessage.objects.create(sender=self.bob, recipient=self.admin, message='Hello')
+        self.client.login(username='settlex', password='pass')
+
+    def test_summaries_come_from_one_query(self):
+        with self.assertNumQueries(1):
+            conversations = conversation_summaries()
+        self.assertEqual([c['name'] for c in conversations], ['bob', 'Alice Adams'])
+        bob, alice = conversations
+        self.assertEqual((alice['preview'], alice['unread_count']), ('On it', 2))
+        self.assertEqual((bob['last_incoming_id'], bob['unread_count']), (self.bob_message.id, 1))
+
+    def test_incremental_updates(self):
+        url = reverse('admin:chat_inbox_updates')
+        self.assertEqual(len(self.client.get(url).json()['conversations']), 2)
+
+        response = self.client.get(url, {'since': self.bob_message.id}).json()
+        self.assertEqual((response['conversations'], response['cursor']), ([], self.bob_message.id))
+
+        reply = ChatMessage.objects.create(sender=self.alice, recipient=self.admin, message='third')
+        response = self.client.get(url, {'since': self.bob_message.id}).json()
+        self.assertEqual([c['user_id'] for c in response['conversations']], [self.alice.id])
+        self.assertEqual(response['cursor'], reply.id)
+
+    def test_inbox_marks_conversations_read_in_bulk(self):
+        response = self.client.get(reverse('admin:chat_inbox'))
+        self.assertContains(response, 'Alice Adams')
+        self.assertContains(response, reverse('admin:chat_reply', args=[self.bob_message.id]))
+
+        response = self.client.post(reverse('admin:chat_inbox'), {'user_ids': [self.alice.id]})
+        self.assertRedirects(response, reverse('admin:chat_inbox'))
+        bob, alice = conversation_summaries()
+        self.assertEqual((alice['unread_count'], bob['unread_count']), (0, 1))
+        state = ChatReadState.objects.get(user=self.alice)
+        self.assertEqual((state.user_read_up_to, state.staff_read_up_to),
+                         (0, ChatMessage.objects.filter(sender=self.alice).latest('id').id))
+
+    def test_reply_marks_conversation_read(self):
+        self.client.post(reverse('admin:chat_reply', args=[self.bob_message.id]), {'reply_message': 'Hi Bob'})
+        self.assertEqual(ChatReadState.objects.get(user=self.bob).staff_read_up_to, self.bob_message.id)
+        self.assertTrue(ChatMessage.objects.filter(sender=self.admin, recipient=self.bob, message='Hi Bob').exists())
+
+    def test_reply_clears_staff_typing(self):
+        set_typing(self.admin, True, self.bob.id)
+        self.assertTrue(peer_is_typing(self.bob))
+        self.client.post(reverse('admin:chat_reply', args=[self.bob_message.id]), {'reply_message': 'Hi Bob'})
+        self.assertFalse(peer_is_typing(self.bob))
+
+    def test_reply_requires_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.admin)
+        url = reverse('admin:chat_reply', args=[self.bob_message.id])
+        self.assertEqual(client.post(url, {'reply_message': 'Hi Bob'}).status_code, 403)
+        self.assertFalse(ChatReadState.objects.filter(user=self.bob).exists())
+
+        token = client.get(url).context['csrf_token']
+        self.assertEqual(client.post(url, {'reply_message': 'Hi Bob', 'csrfmiddlewaretoken': token}).status_code, 302)
@@ -0,0 +1,431 @@
+import json
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from Settlex import settings
+
+from .chat import (
+    build_chat_delta, mark_messages_read, record_read_receipt, sent_read_up_to, typing_cache_key, unread_messages,
+)
+from .models import ChatMessage, ChatReadState
+from .notifier import BaseChatNotifier, LocalChatNotifier, check_notifier_backend, park_slot
+from .routing import websocket_urlpatterns
+
+MIDDLEWARE_NO_ENFORCE = [mw for mw in settings.MIDDLEWARE if mw != 'Settlex.middleware.enforce_2fa.Enforce2FAMiddleware']
+
+
+@override_settings(MIDDLEWARE=MIDDLEWARE_NO_ENFORCE, CHAT_LONG_POLL_TIMEOUT=0)
+class ChatSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='conveyancer', password='pass')
+        self.admin = User.objects.create_superuser(username='settlex', password='pass', email='a@example.com')
+        self.client.login(username='conveyancer', password='pass')
+        self.url = reverse('settlements_app:long_poll_messages')
+
+    def _sync(self, **params):
+        resp = self.client.get(self.url, params)
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_initial_sync_returns_history(self):
+        ChatMessage.objects.create(sender=self.user, recipient=self.admin, message='hello')
+        ChatMessage.objects.create(sender=self.admin, recipient=self.user, message='hi')
+
+        data = self._sync()
+        self.assertEqual([m['message'] for m in data['messages']], ['hello', 'hi'])
+        self.assertEqual(data['last_message_id'], data['messages'][-1]['id'])
+        self.assertEqual(data['read_up_to'], 0)
+
+    def test_cursor_returns_only_new_messages(self):
+        first = ChatMessage.objects.create(sender=self.user, recipient=self.admin, message='hello')
+        cursor = self._sync()
+
+        data = self._sync(last_message_id=cursor['last_message_id'])
+        self.assertEqual(data['messages'], [])
+        self.assertEqual(data['last_message_id'], first.id)
+
+        reply = ChatMessage.objects.create(sender=self.admin, recipient=self.user, message='hi')
+        data = self._sync(last_message_id=cursor['last_message_id'])
+        self.assertEqual([m['id'] for m in data['messages']], [reply.id])
+
+    @override_settings(BACKGROUND_TASKS_EAGER=True,
+                       CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_read_receipts_move_the_watermark(self):
+        cache.clear()
+        sent = ChatMessage.objects.create(sender=self.user, recipient=self.admin, message='hello')
+        cursor = self._sync()
+        self.assertEqual((cursor['read_up_to'], cursor['messages'][0]['is_read']), (0, False))
+
+        self.client.logout()
+        self.client.login(username='settlex', password='pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(
+                reverse('settlements_app:mark_messages_read'),
+                data=json.dumps({'message_ids': [sent.id]}),
+                content_type='application/json')
+        self.assertEqual(resp.json()['updated'], 1)
+
+        self.client.logout()
+        self.client.login(username='conveyancer', password='pass')
+        data = self._sync(last_message_id=cursor['last_message_id'], read_up_to=0)
+        self.assertEqual(data['read_up_to'], sent.id)
+        self.assertTrue(self._sync()['messages'][0]['is_read'])
+
+    def test_read_receipts_reject_ids_that_are_not_message_ids(self):
+        url = reverse('settlements_app:mark_messages_read')
+        for body in ({'message_ids': ['99999999999999999999']}, {'message_ids': 'x'}, [1]):
+            resp = self.client.post(url, data=json.dumps(body), content_type='application/json')
+            self.assertEqual(resp.status_code, 400)
+
+    def test_query_count_is_independent_of_history_size(self):
+        ChatMessage.objects.create(sender=self.user, recipient=self.admin, message='first')
+        with self.assertNumQueries(2):
+            data = build_chat_delta(self.user)
+        self.assertEqual(len(data['messages']), 1)
+
+        ChatMessage.objects.bulk_create([
+            ChatMessage(sender=self.admin if i % 2 else self.user,
+                        recipient=self.user if i % 2 else self.admin,
+                        message=f'message {i}')
+            for i in range(30)
+        ])
+        with self.assertNumQueries(2):
+            data = build_chat_delta(self.user)
+        self.assertEqual(len(data['messages']), 31)
+        self.assertEqual(data['messages'][-1]['sender_name'], 'settlex')
+
+        with self.assertNumQueries(2):
+            build_chat_delta(self.user, data['last_message_id'])
+
+    def test_non_finite_timeout_is_ignored(self):
+        with override_settings(CHAT_LONG_POLL_TIMEOUT=0.1):
+            started = time.monotonic()
+            self._sync(timeout='nan')
+            self._sync(timeout='inf')
+            self.assertLess(time.monotonic() - started, 2)
+
+    def test_polls_answer_at_once_when_every_parking_slot_is_taken(self):
+        cursor = self._sync()['last_message_id']
+        with override_settings(CHAT_LONG_POLL_TIMEOUT=5, CHAT_LONG_POLL_MAX_PARKED=1):
+            with park_slot() as parked:
+                self.assertTrue(parked)
+                started = time.monotonic()
+                data = self._sync(last_message_id=cursor)
+                self.assertLess(time.monotonic() - started, 2)
+            self.assertEqual(data['retry_after'], settings.CHAT_LONG_POLL_BUSY_RETRY)
+
+            with park_slot() as parked:  # Released again
+                self.assertTrue(parked)
+
+    def test_requires_authentication(self):
+        self.client.logout()
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 401)
+
+
+@override_settings(MIDDLEWARE=MIDDLEWARE_NO_ENFORCE, CHAT_LONG_POLL_TIMEOUT=5,
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TypingStateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='conveyancer', password='pass')
+        self.admin = User.objects.create_superuser(username='settlex', password='pass', email='a@example.com')
+        self.typing_url = reverse('settlements_app:chat_typing')
+        self.sync_url = reverse('settlements_app:long_poll_messages')
+
+    def _staff_typing(self, is_typing):
+        self.client.login(username='settlex', password='pass')
+        response = self.client.post(self.typing_url, {'is_typing': is_typing, 'user_id': self.user.id})
+        self.assertEqual(response.json(), {'status': 'success'})
+
+    def _user_sync(self, **params):
+        self.client.login(username='conveyancer', password='pass')
+        return self.client.get(self.sync_url, {'timeout': 0, **params}).json()
+
+    def test_staff_typing_is_part_of_the_users_sync(self):
+        self.assertFalse(self._user_sync()['is_typing'])
+        self._staff_typing('true')
+        self.assertTrue(self._user_sync()['is_typing'])
+        self._staff_typing('false')
+        self.assertFalse(self._user_sync()['is_typing'])
+
+    def test_typing_flag_expires(self):
+        self._staff_typing('true')
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=time.time() + 60):
+            self.assertFalse(self._user_sync()['is_typing'])
+
+    def test_changed_typing_state_ends_a_long_poll_at_once(self):
+        self._staff_typing('true')
+        started = time.monotonic()
+        payload = self._user_sync(timeout=5, is_typing='false')
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertTrue(payload['is_typing'])
+
+    def test_shown_typing_caps_the_long_poll_at_the_flag_lifetime(self):
+        self._staff_typing('true')
+        started = time.monotonic()
+        with mock.patch('settlements_app.views.TYPING_TIMEOUT', 0.2):
+            self._user_sync(timeout=5, is_typing='true')
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_only_staff_typing_is_recorded(self):
+        self.client.login(username='conveyancer', password='pass')
+        self.assertEqual(self.client.post(self.typing_url, {'is_typing': 'true'}).status_code, 403)
+        self.assertEqual(self.client.get(self.typing_url).status_code, 400)
+        self.assertFalse(cache.get(typing_cache_key(self.user.id)))
+
+
+@override_settings(MIDDLEWARE=MIDDLEWARE_NO_ENFORCE, CHAT_LONG_POLL_TIMEOUT=5, BACKGROUND_TASKS_EAGER=True,
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ReadReceiptTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='conveyancer', password='pass')
+        self.admin = User.objects.create_superuser(username='settlex', password='pass', email='a@example.com')
+        self.replies = [
+            ChatMessage.objects.create(sender=self.admin, recipient=self.user, message=f'reply {n}') for n in range(3)]
+
+    def _watermarks(self):
+        state = ChatReadState.objects.get(user=self.user)
+        return state.user_read_up_to, state.staff_read_up_to
+
+    def test_receipts_are_written_at_once_and_repeats_cost_nothing(self):
+        ChatReadState.objects.create(user=self.user)
+        with self.assertNumQueries(2):  # Clamp to a received message, then one conditional UPDATE
+            mark_messages_read(self.user, [self.replies[0].id])
+        self.assertEqual(self._watermarks(), (self.replies[0].id, 0))
+
+        with self.assertNumQueries(0):
+            mark_messages_read(self.user, [self.replies[0].id])
+
+        cache.clear()  # A lost cache entry only costs the write again
+        with self.assertNumQueries(2):
+            mark_messages_read(self.user, [self.replies[-1].id])
+        self.assertEqual(self._watermarks(), (self.replies[-1].id, 0))
+        self.assertFalse(unread_messages(self.user).exists())
+
+    def test_staff_sync_reports_how_far_recipients_have_read(self):
+        other = User.objects.create_user(username='other')
+        to_other = ChatMessage.objects.create(sender=self.admin, recipient=other, message='hello')
+        self.assertLess(build_chat_delta(self.admin)['read_up_to'], self.replies[0].id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_messages_read(self.user, [self.replies[1].id])
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_messages_read(other, [to_other.id])
+        with self.assertNumQueries(1):
+            self.assertEqual(sent_read_up_to(self.admin), self.replies[1].id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_messages_read(self.user, [self.replies[-1].id])
+        self.assertEqual(build_chat_delta(self.admin)['read_up_to'], to_other.id)
+
+    def test_watermark_never_moves_back_or_past_received_messages(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record_read_receipt(self.user.id, 'user', self.replies[1].id + 1000)
+        self.assertEqual(self._watermarks(), (self.replies[-1].id, 0))
+
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            record_read_receipt(self.user.id, 'user', self.replies[0].id)
+        self.assertEqual(self._watermarks(), (self.replies[-1].id, 0))
+
+    def test_check_new_messages_counts_and_marks_read(self):
+        self.client.login(username='conveyancer', password='pass')
+        url = reverse('settlements_app:check_new_messages')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.get(url).json()['new_messages'], 3)
+        self.assertEqual(self.client.get(url).json()['new_messages'], 0)
+
+    def test_staff_receipt_ends_the_users_long_poll_at_once(self):
+        sent = ChatMessage.objects.create(sender=self.user, recipient=self.admin, message='hello')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(mark_messages_read(self.admin, [sent.id, self.replies[0].id]), 1)
+
+        self.client.login(username='conveyancer', password='pass')
+        started = time.monotonic()
+        payload = self.client.get(reverse('settlements_app:long_poll_messages'),
+                                  {'last_message_id': sent.id, 'read_up_to': 0}).json()
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(payload['read_up_to'], sent.id)
+
+
+@override_settings(MIDDLEWARE=MIDDLEWARE_NO_ENFORCE, CHAT_LONG_POLL_TIMEOUT=0, SESSION_REFRESH_INTERVAL=300,
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class SessionRefreshTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(username='conveyancer', password='pass')
+        self.client.login(username='conveyancer', password='pass')
+        self.poll_url = reverse('settlements_app:long_poll_messages')
+
+    def _session_saves(self, url):
+        with mock.patch.object(SessionStore, 'save', autospec=True, side_effect=SessionStore.save) as save:
+            self.client.get(url)
+        return save.call_count
+
+    def _poll_refreshes_cookie(self, url):
+        with mock.patch.object(SessionStore, 'save', autospec=True, side_effect=SessionStore.save) as save:
+            response = self.client.get(url)
+        self.assertEqual(save.call_count, 0)  # Polling views never rewrite the session data
+        return 'sessionid' in response.cookies
+
+    def test_polling_views_move_session_expiry_at_most_once_per_interval(self):
+        Session.objects.update(expire_date=now() + timedelta(minutes=5))
+        self.assertTrue(self._poll_refreshes_cookie(self.poll_url))
+        self.assertGreater(Session.objects.get().expire_date, now() + timedelta(hours=23))
+
+        self.assertFalse(self._poll_refreshes_cookie(self.poll_url))
+        self.assertFalse(self._poll_refreshes_cookie(reverse('settlements_app:check_new_messages')))
+
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=time.time() + 301):
+            self.assertTrue(self._poll_refreshes_cookie(self.poll_url))
+
+    def test_parked_poll_keeps_session_changes_made_meanwhile(self):
+        session_key = self.client.session.session_key
+
+        def other_request_writes_session(*args):
+            other = SessionStore(session_key)
+            other['wizard_step'] = 'token'
+            other.save()
+            return build_chat_delta(*args)
+
+        with mock.patch('settlements_app.views.build_chat_delta', side_effect=other_request_writes_session):
+            self.client.get(self.poll_url)
+        self.assertEqual(SessionStore(session_key)['wizard_step'], 'token')
+
+    def test_other_views_refresh_session_every_request(self):
+        url = reverse('settlements_app:home')
+        self.assertEqual(self._session_saves(url), 1)
+        self.assertEqual(self._session_saves(url), 1)
+
+
+class RecordingNotifier(BaseChatNotifier):
+    published = []
+
+    def publish(self, user_id):
+        self.published.append(user_id)
+
+
+class ChatNotifierTests(TestCase):
+    def test_local_listener_wakes_on_publish(self):
+        notifier = LocalChatNotifier()
+        with notifier.listen(7) as listener:
+            threading.Timer(0.05, notifier.publish, args=[7]).start()
+            started = time.monotonic()
+            self.assertTrue(listener.wait(5))
+            self.assertLess(time.monotonic() - started, 1)
+
+    def test_local_listener_ignores_other_users_and_times_out(self):
+        notifier = LocalChatNotifier()
+        with notifier.listen(7) as listener:
+            notifier.publish(8)
+            self.assertFalse(listener.wait(0.05))
+
+    def test_publish_before_wait_is_not_lost(self):
+        notifier = LocalChatNotifier()
+        with notifier.listen(7) as listener:
+            notifier.publish(7)
+            self.assertTrue(listener.wait(0))
+
+    def test_local_notifier_refuses_several_processes(self):
+        with mock.patch.dict('os.environ', {'WEB_CONCURRENCY': '4'}):
+            with override_settings(CHAT_NOTIFIER_BACKEND='settlements_app.notifier.LocalChatNotifier'):
+                with self.assertRaises(ImproperlyConfigured):
+                    check_notifier_backend()
+            with override_settings(CHAT_NOTIFIER_BACKEND='settlements_app.notifier.RedisChatNotifier'):
+                check_notifier_backend()
+        with override_settings(CHAT_NOTIFIER_BACKEND='settlements_app.notifier.LocalChatNotifier'):
+            check_notifier_backend()
+
+    @override_settings(CHAT_NOTIFIER_BACKEND='settlements_app.tests_chat.RecordingNotifier')
+    def test_new_message_wakes_both_participants(self):
+        user = User.objects.create_user(username='conveyancer', password='pass')
+        admin = User.objects.create_superuser(username='settlex', password='pass', email='a@example.com')
+        RecordingNotifier.published = []
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ChatMessage.objects.create(sender=admin, recipient=user, message='hi')
+
+        self.assertCountEqual(RecordingNotifier.published, [admin.id, user.id])
+
+
+class ChatConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='conveyancer', password='pass')
+        self.admin = User.objects.create_superuser(username='settlex', password='pass', email='a@example.com')
+
+    async def _connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/chat/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def test_pushes_new_messages_after_sync(self):
+        async def scenario():
+            communicator = await self._connect(self.user)
+            await communicator.send_json_to({'type': 'sync', 'last_message_id': 0})
+            initial = await communicator.receive_json_from()
+            self.assertEqual(initial['type'], 'sync')
+            self.assertEqual(initial['messages'], [])
+
+            await database_sync_to_async(ChatMessage.objects.create)(
+                sender=self.admin, recipient=self.user, message='hi')
+            pushed = await communicator.receive_json_from(timeout=2)
+            self.assertEqual([m['message'] for m in pushed['messages']], ['hi'])
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_malformed_frames_keep_the_connection(self):
+        async def scenario():
+            communicator = await self._connect(self.user)
+            await communicator.send_json_to(['sync'])
+            await communicator.send_json_to({'type': 'read', 'message_ids': '12'})
+            await communicator.send_json_to({'type': 'read', 'message_ids': [{'id': 1}, 'x', 10 ** 30]})
+            await communicator.send_json_to({'type': 'sync', 'last_message_id': 0})
+            response = await communicator.receive_json_from(timeout=2)
+            self.assertEqual(response['type'], 'sync')
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_staff_typing_frames_reach_the_users_socket(self):
+        async def scenario():
+            client = await self._connect(self.user)
+            await client.send_json_to({'type': 'sync', 'last_message_id': 0})
+            await client.receive_json_from(timeout=2)
+            staff = await self._connect(self.admin)
+            await staff.send_json_to({'type': 'typing', 'is_typing': True, 'user_id': self.user.id})
+            event = await client.receive_json_from(timeout=2)
+            self.assertEqual((event['type'], event['is_typing']), ('sync', True))
+            await client.send_json_to({'type': 'typing', 'is_typing': True})  # Ignored: only staff typing is shown
+            self.assertTrue(await client.receive_nothing(timeout=0.5))
+            await client.disconnect()
+            await staff.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_rejects_anonymous_connections(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/chat/')
+            communicator.scope['user'] = AnonymousUser()
+            connected, _ = await communicator.connect()
+            self.assertFalse(connected)
+
+        async_to_sync(scenario)()
@@ -0,0 +1,64 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.admin.sites import AdminSite
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core import mail
+from django.test import RequestFactory, TestCase
+from django.utils.timezone import now
+
+from .admin import UserAdmin, send_activation_email
+from .mail import MAX_ATTEMPTS, deliver_queued_mail, queue_mail
+from .models import DeadLetterEmail, OutboundEmail
+
+
+class OutboundEmailQueueTests(TestCase):
+    def test_queued_mail_is_sent_by_worker_not_request(self):
+        queue_mail("Hello", "Body", ["a@example.com"])
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(deliver_queued_mail(), (1, 0))
+        self.assertEqual(mail.outbox[0].to, ["a@example.com"])
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.status, "sent")
+        self.assertIsNotNone(email.sent_at)
+        self.assertEqual(deliver_queued_mail(), (0, 0))
+
+    def test_batch_reuses_one_connection(self):
+        for n in range(3):
+            queue_mail("Hello", "Body", [f"user{n}@example.com"])
+        with mock.patch("settlements_app.mail.get_connection", wraps=mail.get_connection) as get_connection:
+            self.assertEqual(deliver_queued_mail(), (3, 0))
+        get_connection.assert_called_once()
+
+    def test_failures_back_off_then_dead_letter(self):
+        email = queue_mail("Hello", "Body", ["a@example.com"])
+        with mock.patch("django.core.mail.EmailMessage.send", side_effect=OSError("SMTP down")):
+            self.assertEqual(deliver_queued_mail(), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), ("pending", 1))
+            self.assertGreater(email.next_attempt_at, now() + timedelta(seconds=30))
+            self.assertEqual(deliver_queued_mail(), (0, 0))  # Not due yet
+
+            for _ in range(MAX_ATTEMPTS - 1):
+                OutboundEmail.objects.update(next_attempt_at=now())
+                deliver_queued_mail()
+
+        email.refresh_from_db()
+        self.assertEqual(email.status, "failed")
+        self.assertIn("SMTP down", email.last_error)
+        self.assertEqual(list(DeadLetterEmail.objects.filter(status="failed")), [email])
+
+    def test_bulk_activation_queues_without_sending(self):
+        User.objects.bulk_create(
+            User(username=f"user{n}", email=f"user{n}@example.com", is_active=True) for n in range(200))
+        request = RequestFactory().post("/admin/auth/user/")
+        request.session = {}
+        request._messages = FallbackStorage(request)
+
+        # One SELECT of the users and one bulk INSERT (inside a savepoint)
+        with self.assertNumQueries(4):
+            send_activation_email(UserAdmin(User, AdminSite()), request, User.objects.all())
+        self.assertEqual(OutboundEmail.objects.filter(status="pending").count(), 200)
+        self.assertEqual(len(mail.outbox), 0)
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from .chat import conversation_messages, history_messages, sent_read_up_to, unread_messages
+from .models import ChatMessage, Firm, Instruction
+
+
+class ChatQueryPlanTests(TestCase):
+    """EXPLAIN regression checks for the chat hot queries (SQLite and PostgreSQL)."""
+
+    def setUp(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('Query plans are only pinned for SQLite and PostgreSQL.')
+        self.user = User.objects.create_user(username='conveyancer')
+
+    def _plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Test tables are tiny; keep the planner from preferring sequential scans.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_long_poll_history_uses_timestamp_indexes(self):
+        plan = self._plan(history_messages(self.user, now() - timedelta(days=7)))
+        self.assertIn('chat_sender_ts_idx', plan)
+        self.assertIn('chat_recipient_ts_idx', plan)
+
+    def test_long_poll_delta_uses_participant_indexes(self):
+        plan = self._plan(conversation_messages(self.user).filter(id__gt=10).order_by('id'))
+        self.assertNotIn('SCAN settlements_app_chatmessage', plan)
+        self.assertNotIn('Seq Scan', plan)
+
+    def test_unread_messages_use_recipient_index(self):
+        # Past the read watermark: the recipient's messages, not a table scan
+        for user in (self.user, User.objects.create_superuser(username='settlex')):
+            plan = self._plan(unread_messages(user))
+            self.assertNotIn('SCAN settlements_app_chatmessage', plan)
+            self.assertNotIn('Seq Scan on settlements_app_chatmessage', plan)
+
+    def test_admin_year_bounds_read_one_row_off_the_timestamp_index(self):
+        plan = self._plan(ChatMessage.objects.order_by('timestamp').values_list('timestamp')[:1])
+        self.assertIn('chat_timestamp_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_staff_read_watermark_walks_conversations_not_messages(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Pinned on the SQLite plan.')
+        staff = User.objects.create_superuser(username='settlex')
+        with CaptureQueriesContext(connection) as queries:
+            sent_read_up_to(staff)
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {queries[0]['sql']}")
+            plan = '\n'.join(row[-1] for row in cursor.fetchall())
+        # Messages are only read in the per-user subquery (alias U0), never as the outer loop
+        self.assertNotIn('SCAN settlements_app_chatmessage', plan)
+        self.assertNotIn('SEARCH settlements_app_chatmessage ', plan)
+        self.assertIn('recipient', plan)
+
+class InstructionQueryPlanTests(TestCase):
+    """EXPLAIN regression checks for the firm-wide settlement listing."""
+
+    def test_firm_listing_is_an_index_range_scan(self):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.skipTest('Query plans are only pinned for SQLite and PostgreSQL.')
+        firm = Firm.objects.create(name='Alpha Legal', contact_email='alpha@example.com')
+        queryset = Instruction.objects.filter(firm=firm).order_by('-settlement_date', '-id')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertIn('instruction_firm_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertNotIn('Sort', plan)
@@ -1,9 +1,17 @@
-from django.test import TestCase, override_settings
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django_otp.plugins.otp_totp.models import TOTPDevice
 from django_otp.oath import totp
 from Settlex import settings
+from Settlex.middleware.enforce_2fa import Enforce2FAMiddleware
+
+from .deployment import check_shared_cache
 
 MIDDLEWARE_NO_ENFORCE = [mw for mw in settings.MIDDLEWARE if mw != 'Settlex.middleware.enforce_2fa.Enforce2FAMiddleware']
 
@@ -66,4 +74,49 @@ class TwoFactorSetupFlowTests(TestCase):
         # Assert that the setup is complete
         self.assertRedirects(resp, reverse('two_factor:setup_complete'))
         device.refresh_from_db()
-        self.assertTrue(device.confirmed)
\ No newline at end of file
+        self.assertTrue(device.confirmed)
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class Enforce2FAMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='gated', password='pass')
+        self.middleware = Enforce2FAMiddleware(lambda request: HttpResponse('ok'))
+
+    def _request(self, path='/my-settlements/'):
+        request = RequestFactory().get(path)
+        request.user = User.objects.get(pk=self.user.pk)  # Fresh user object, as on a new request
+        return request
+
+    def test_user_without_device_is_redirected_to_setup(self):
+        response = self.middleware(self._request())
+        self.assertRedirects(response, reverse('settlements_app:two_factor_setup'), fetch_redirect_response=False)
+        self.assertEqual(self.middleware(self._request(reverse('settlements_app:logout'))).status_code, 200)
+
+    def test_device_flag_is_cached_and_invalidated_by_device_changes(self):
+        self.middleware(self._request())
+        request = self._request()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.middleware(request).status_code, 302)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            device = TOTPDevice.objects.create(user=self.user, name='default', confirmed=True)
+        self.assertEqual(self.middleware(self._request()).status_code, 200)
+        request = self._request()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.middleware(request).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            device.delete()
+        self.assertEqual(self.middleware(self._request()).status_code, 302)
+
+    def test_several_processes_need_a_shared_cache(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        dummy = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with mock.patch.dict('os.environ', {'WEB_CONCURRENCY': '4'}):
+            with override_settings(CACHES=locmem), self.assertRaises(ImproperlyConfigured):
+                check_shared_cache()
+            with override_settings(CACHES=dummy):
+                check_shared_cache()
+        with override_settings(CACHES=locmem):
+            check_shared_cache()
@@ -0,0 +1,383 @@
+import hashlib
+import io
+import shutil
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from Settlex import settings
+
+from .models import Blob, ChatMessage, Document, Firm, Instruction, Solicitor
+from .storage import ContentAddressedStorage
+from .tasks import run_in_background
+from .views import download_document
+
+MIDDLEWARE_NO_ENFORCE = [mw for mw in settings.MIDDLEWARE if mw != 'Settlex.middleware.enforce_2fa.Enforce2FAMiddleware']
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MIDDLEWARE=MIDDLEWARE_NO_ENFORCE, MEDIA_ROOT=MEDIA_ROOT, DOCUMENT_UPLOAD_MAX_SIZE=4096,
+                   CHAT_UPLOAD_MAX_SIZE=4096)
+class StreamingUploadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='solicitor', password='pass')
+        firm = Firm.objects.create(name='Alpha Legal', contact_email='alpha@example.com')
+        solicitor = Solicitor.objects.create(user=self.user, instructing_solicitor='Sam Solicitor', firm=firm)
+        self.instruction = Instruction.objects.create(solicitor=solicitor, title_reference='123/456')
+        self.client.login(username='solicitor', password='pass')
+        self.url = reverse('settlements_app:upload_documents')
+
+    def _upload(self, size, client=None):
+        return (client or self.client).post(self.url, {
+            'instruction_id': self.instruction.id,
+            'document_name': 'Contract',
+            'document': SimpleUploadedFile('contract.pdf', b'x' * size),
+        })
+
+    def test_upload_records_sha256(self):
+        response = self._upload(1000)
+        self.assertRedirects(response, reverse('settlements_app:view_settlement', args=[self.instruction.id]))
+        document = Document.objects.get()
+        self.assertEqual(document.sha256, hashlib.sha256(b'x' * 1000).hexdigest())
+
+    def test_upload_over_cap_is_rejected_while_streaming(self):
+        response = self._upload(5000)
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertFalse(Document.objects.exists())
+
+    def test_upload_over_cap_is_rejected_from_content_length(self):
+        response = self._upload(200 * 1024)
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertFalse(Document.objects.exists())
+
+    def test_csrf_is_still_enforced(self):
+        client = Client(enforce_csrf_checks=True)
+        client.login(username='solicitor', password='pass')
+        self.assertEqual(self._upload(1000, client).status_code, 403)
+
+    def test_chat_file_over_cap_returns_413(self):
+        admin = User.objects.create_superuser(username='settlex', password='pass', email='a@example.com')
+        response = self.client.post(reverse('settlements_app:send_message'), {
+            'recipient': admin.id,
+            'file': SimpleUploadedFile('big.pdf', b'x' * 5000),
+        })
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(ChatMessage.objects.exists())
+
+
+scanned = []
+
+
+def record_scan(document):
+    scanned.append(document.name)
+
+
+@override_settings(MIDDLEWARE=MIDDLEWARE_NO_ENFORCE, MEDIA_ROOT=MEDIA_ROOT, BACKGROUND_TASKS_EAGER=True,
+                   DOCUMENT_SCAN_HOOK='settlements_app.tests_uploads.record_scan')
+class BulkDocumentUploadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='solicitor', password='pass')
+        firm = Firm.objects.create(name='Alpha Legal', contact_email='alpha@example.com')
+        solicitor = Solicitor.objects.create(user=self.user, instructing_solicitor='Sam Solicitor', firm=firm)
+        self.instruction = Instruction.objects.create(solicitor=solicitor, title_reference='123/456')
+        self.client.login(username='solicitor', password='pass')
+        self.url = reverse('settlements_app:upload_documents')
+        scanned.clear()
+
+    def test_several_files_are_created_in_one_request(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {
+                'instruction_id': self.instruction.id,
+                'documents': [
+                    SimpleUploadedFile('contract.pdf', b'%PDF contract'),
+                    SimpleUploadedFile('search.txt', b'Title search'),
+                    SimpleUploadedFile('asic.pdf', b'%PDF asic'),
+                ],
+                'document_names': ['Contract of Sale', '', 'ASIC Extract'],
+                'document_types': ['contract', 'title_search', 'asic_extract'],
+            })
+        self.assertRedirects(response, reverse('settlements_app:view_settlement', args=[self.instruction.id]))
+
+        documents = {document.name: document for document in Document.objects.select_related('blob')}
+        self.assertEqual(
+            {name: document.document_type for name, document in documents.items()},
+            {'Contract of Sale': 'contract', 'search.txt': 'title_search', 'ASIC Extract': 'asic_extract'})
+        self.assertEqual(documents['search.txt'].sha256, hashlib.sha256(b'Title search').hexdigest())
+        self.assertEqual(documents['search.txt'].blob.text_extract, 'Title search')
+        self.assertEqual(sorted(scanned), sorted(documents))
+        self.assertIn('ASIC Extract', self.instruction.search_document.body)
+
+    def test_unknown_type_rejects_the_whole_upload(self):
+        response = self.client.post(self.url, {
+            'instruction_id': self.instruction.id,
+            'documents': [SimpleUploadedFile('a.pdf', b'a'), SimpleUploadedFile('b.pdf', b'b')],
+            'document_types': ['contract', 'other'],
+        })
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertFalse(Document.objects.exists())
+        self.assertFalse(Blob.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='solicitor')
+        solicitor = Solicitor.objects.create(user=self.user, instructing_solicitor='Sam Solicitor')
+        self.instruction = Instruction.objects.create(solicitor=solicitor, title_reference='123/456')
+
+    def _document(self, content=b'%PDF contract', name='contract.pdf'):
+        return Document.objects.create(
+            instruction=self.instruction, name=name, file=SimpleUploadedFile(name, content))
+
+    def test_identical_files_share_one_blob(self):
+        first, second = self._document(), self._document(name='copy.PDF')
+        admin = User.objects.create_superuser(username='settlex', email='a@example.com')
+        message = ChatMessage.objects.create(
+            sender=self.user, recipient=admin, file=SimpleUploadedFile('scan.pdf', b'%PDF contract'))
+
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 3)
+        self.assertEqual({first.file.name, second.file.name, message.file.name}, {blob.file.name})
+        self.assertTrue(blob.file.name.endswith(f'{blob.sha256}.pdf'))
+        self.assertEqual(first.sha256, blob.sha256)
+
+    def test_concurrent_save_of_the_same_content_keeps_the_first_file(self):
+        storage = ContentAddressedStorage(location=MEDIA_ROOT)
+        name = storage.save('blobs/race/same.pdf', ContentFile(b'same'))
+        results = []
+        # The other request's file appears between the exists() check and the exclusive create
+        with mock.patch.object(ContentAddressedStorage, 'exists', side_effect=[False, True]):
+            worker = threading.Thread(
+                target=lambda: results.append(storage.save(name, ContentFile(b'same'))), daemon=True)
+            worker.start()
+            worker.join(timeout=5)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(results, [name])
+        self.assertEqual(storage.open(name).read(), b'same')
+
+    def test_blob_file_is_removed_with_last_reference(self):
+        first, second = self._document(), self._document()
+        name = first.file.name
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(default_storage.exists(name))
+
+    def test_dedupe_media_moves_legacy_files_into_blobs(self):
+        names = [default_storage.save(f'settlements/documents/legacy{n}.pdf', ContentFile(b'same')) for n in range(2)]
+        Document.objects.bulk_create(
+            Document(instruction=self.instruction, name=name, file=name) for name in names)
+
+        call_command('dedupe_media', stdout=StringIO())
+
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(set(Document.objects.values_list('file', flat=True)), {blob.file.name})
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+
+
+@override_settings(MIDDLEWARE=MIDDLEWARE_NO_ENFORCE, MEDIA_ROOT=MEDIA_ROOT, PROTECTED_MEDIA_SERVER='')
+class DocumentDownloadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='solicitor', password='pass')
+        firm = Firm.objects.create(name='Alpha Legal', contact_email='alpha@example.com')
+        solicitor = Solicitor.objects.create(user=self.user, instructing_solicitor='Sam Solicitor', firm=firm)
+        instruction = Instruction.objects.create(solicitor=solicitor, title_reference='123/456')
+        self.document = Document.objects.create(
+            instruction=instruction, name='Contract', file=SimpleUploadedFile('contract.pdf', b'0123456789'))
+        self.url = reverse('settlements_app:download_document', args=[self.document.id])
+        self.client.login(username='solicitor', password='pass')
+
+    def test_other_firms_get_404(self):
+        other = User.objects.create_user(username='other', password='pass')
+        Solicitor.objects.create(
+            user=other, instructing_solicitor='Olive Other',
+            firm=Firm.objects.create(name='Beta Legal', contact_email='beta@example.com'))
+        self.client.login(username='other', password='pass')
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_full_download_with_etag(self):
+        response = self.client.get(self.url + '?download=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['ETag'], f'"{self.document.sha256}"')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="Contract.pdf"')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{self.document.sha256}"')
+        self.assertEqual(response.status_code, 304)
+
+    def test_pdf_is_shown_inline_in_a_sandbox(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="Contract.pdf"')
+        self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+
+    def test_html_is_never_served_inline(self):
+        instruction = self.document.instruction
+        for name, upload in (('invoice.html', 'invoice.pdf'), ('invoice.html', 'invoice.html')):
+            document = Document.objects.create(
+                instruction=instruction, name=name, file=SimpleUploadedFile(upload, f'<script>{upload}</script>'.encode()))
+            response = self.client.get(reverse('settlements_app:download_document', args=[document.id]))
+            if upload.endswith('.pdf'):  # The stored file decides the type, not the name typed in
+                self.assertEqual(response['Content-Type'], 'application/pdf')
+            else:
+                self.assertEqual(response['Content-Type'], 'application/octet-stream')
+                self.assertTrue(response['Content-Disposition'].startswith('attachment;'))
+            self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_web_server_handoff_costs_one_query(self):
+        request = RequestFactory().get(self.url)
+        request.user = self.user
+        with override_settings(PROTECTED_MEDIA_SERVER='nginx'), self.assertNumQueries(1):
+            response = download_document(request, self.document.id)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.document.file.name)
+        self.assertEqual(response.content, b'')
+
+        with override_settings(PROTECTED_MEDIA_SERVER='apache'):
+            response = download_document(request, self.document.id)
+        self.assertTrue(response['X-Sendfile'].endswith(self.document.file.name))
+
+
+@override_settings(MIDDLEWARE=MIDDLEWARE_NO_ENFORCE, MEDIA_ROOT=MEDIA_ROOT, PROTECTED_MEDIA_SERVER='')
+class ChatFileTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='solicitor', password='pass')
+        self.staff = User.objects.create_user(username='settlex', password='pass', is_staff=True)
+        self.message = ChatMessage.objects.create(
+            sender=self.user, recipient=self.staff, file=SimpleUploadedFile('scan.pdf', b'%PDF-scan'))
+        self.url = reverse('settlements_app:chat_file', args=[self.message.id])
+
+    def test_media_url_is_not_served(self):
+        self.client.login(username='solicitor', password='pass')
+        self.assertEqual(self.client.get(settings.MEDIA_URL + self.message.file.name).status_code, 404)
+
+    def test_only_participants_and_staff_get_the_file(self):
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+        User.objects.create_user(username='other', password='pass')
+        self.client.login(username='other', password='pass')
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        for username in ('solicitor', 'settlex'):
+            self.client.login(username=username, password='pass')
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), b'%PDF-scan')
+
+    def test_html_attachments_are_downloaded(self):
+        message = ChatMessage.objects.create(
+            sender=self.user, recipient=self.staff, file=SimpleUploadedFile('x.html', b'<script>alert(1)</script>'))
+        self.client.login(username='settlex', password='pass')
+        response = self.client.get(reverse('settlements_app:chat_file', args=[message.id]))
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment;'))
+        self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+
+    def test_chat_payloads_link_the_protected_view(self):
+        self.client.login(username='solicitor', password='pass')
+        response = self.client.post(reverse('settlements_app:send_message'), {
+            'recipient': self.staff.id, 'file': SimpleUploadedFile('deed.pdf', b'%PDF-deed')})
+        sent = ChatMessage.objects.latest('id')
+        self.assertEqual(response.json()['file_url'], reverse('settlements_app:chat_file', args=[sent.id]))
+
+        messages = self.client.get(reverse('settlements_app:long_poll_messages'), {'timeout': 0}).json()['messages']
+        self.assertEqual({m['file_url'] for m in messages},
+                         {self.url, reverse('settlements_app:chat_file', args=[sent.id])})
+
+    def test_standalone_uploads_are_served_to_the_uploader_only(self):
+        self.assertEqual(self.client.post(reverse('settlements_app:upload_chat_file')).status_code, 401)
+
+        self.client.login(username='solicitor', password='pass')
+        file_url = self.client.post(reverse('settlements_app:upload_chat_file'), {
+            'file': SimpleUploadedFile('note.txt', b'note')}).json()['file_url']
+        self.assertEqual(b''.join(self.client.get(file_url).streaming_content), b'note')
+
+        self.client.login(username='settlex', password='pass')
+        self.assertEqual(self.client.get(file_url).status_code, 404)
+
+
+@override_settings(MIDDLEWARE=MIDDLEWARE_NO_ENFORCE, MEDIA_ROOT=MEDIA_ROOT, BACKGROUND_TASKS_EAGER=True,
+                   PROTECTED_MEDIA_SERVER='')
+class DocumentPreviewTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='solicitor', password='pass')
+        firm = Firm.objects.create(name='Alpha Legal', contact_email='alpha@example.com')
+        solicitor = Solicitor.objects.create(user=user, instructing_solicitor='Sam Solicitor', firm=firm)
+        self.instruction = Instruction.objects.create(solicitor=solicitor, title_reference='123/456')
+        self.client.login(username='solicitor', password='pass')
+
+    def _document(self, name, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            document = Document.objects.create(
+                instruction=self.instruction, name=name, file=SimpleUploadedFile(name, content))
+        return Document.objects.select_related('blob').get(pk=document.pk)
+
+    def test_image_thumbnail_is_generated_and_cached_long_term(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800), 'navy').save(buffer, format='JPEG')
+        document = self._document('id.jpg', buffer.getvalue())
+
+        self.assertIsNotNone(document.blob.previews_generated_at)
+        with default_storage.open(document.blob.thumbnail.name) as thumbnail:
+            self.assertLessEqual(max(Image.open(thumbnail).size), 320)
+
+        response = self.client.get(
+            reverse('settlements_app:document_thumbnail', args=[document.id, document.blob.sha256]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        page = self.client.get(reverse('settlements_app:view_settlement', args=[self.instruction.id]))
+        self.assertContains(page, document.blob.sha256 + '.png')
+
+    def test_text_extract_is_generated(self):
+        document = self._document('notes.txt', b'Settlement notes for 12 Harbour Street')
+        self.assertEqual(document.blob.text_extract, 'Settlement notes for 12 Harbour Street')
+        self.assertFalse(document.blob.thumbnail)
+
+    def test_damaged_file_gets_no_preview(self):
+        document = self._document('broken.png', b'not an image')
+        self.assertIsNotNone(document.blob.previews_generated_at)
+        self.assertFalse(document.blob.thumbnail)
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False)
+    def test_generation_is_queued_after_commit_not_run_inline(self):
+        with mock.patch('settlements_app.tasks.get_executor') as get_executor:
+            with self.captureOnCommitCallbacks() as callbacks:
+                run_in_background(print, 'x')
+            get_executor.assert_not_called()
+            callbacks[0]()
+        get_executor.return_value.submit.assert_called_once()
@@ -0,0 +1,73 @@
+import hashlib
+import logging
+
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+
+logger = logging.getLogger(__name__)
+
+# Allowance for multipart boundaries and ordinary form fields when comparing
+# the request's Content-Length against an upload cap
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams uploaded files to disk chunk by chunk while hashing them, and
+    aborts the upload as soon as the request's file bytes exceed ``max_size``.
+
+    Requests whose Content-Length already exceeds the cap are rejected before
+    any file data is read. Rejection sets ``request.upload_too_large``; each
+    completed file carries its hex SHA-256 digest as ``.sha256``.
+    """
+
+    def __init__(self, request, max_size):
+        super().__init__(request)
+        self.max_size = max_size
+        self.request_too_large = False
+        self.received = 0
+        self.sha256 = None
+
+    def _reject(self):
+        self.request.upload_too_large = True
+        logger.warning(f"🚫 Upload to {self.request.path} rejected: larger than {self.max_size} bytes")
+        raise StopUpload(connection_reset=True)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.request_too_large = content_length > self.max_size + MULTIPART_OVERHEAD
+        return None
+
+    def new_file(self, *args, **kwargs):
+        if self.request_too_large:
+            self._reject()
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self._reject()
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.sha256 = self.sha256.hexdigest()
+        return uploaded_file
+
+
+def upload_too_large(request):
+    """Whether HashingUploadHandler rejected this request's upload (parses the body if needed)."""
+    request.FILES
+    return getattr(request, "upload_too_large", False)
+
+
+def file_sha256(file):
+    """Hex SHA-256 of an uploaded file, reusing the digest computed while streaming it."""
+    digest = getattr(file, "sha256", None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
@@ -3,11 +3,11 @@ from django.contrib.auth import views as auth_views
 
 from .views import (
     home, logout_view, register, new_instruction, upload_documents,
-    my_settlements, solicitor_dashboard, edit_instruction, delete_instruction,
-    view_settlement,
+    my_settlements, my_settlements_page, search_settlements, solicitor_dashboard, edit_instruction, delete_instruction,
+    view_settlement, download_document, document_thumbnail,
     long_poll_messages, check_new_messages, send_message, reply_view,
-    mark_messages_read, check_typing_status, upload_chat_file, delete_message,
-    CustomPasswordResetView
+    mark_messages_read, chat_typing, upload_chat_file, chat_file, chat_upload, delete_message,
+    health_check, CustomPasswordResetView
 )
 from settlements_app.views import SettlexTwoFactorSetupView  # ✅ your custom 2FA setup view
 from two_factor.views import LoginView  # ✅ using default LoginView
@@ -16,6 +16,7 @@ app_name = 'settlements_app'
 
 urlpatterns = [
     path("", home, name="home"),
+    path("health/", health_check, name="health_check"),
     path("login/", LoginView.as_view(), name="login"),
     path("account/two_factor/setup/", SettlexTwoFactorSetupView.as_view(), name="two_factor_setup"),  # ✅ enabled
     path("logout/", logout_view, name="logout"),
@@ -24,10 +25,14 @@ urlpatterns = [
     path("new-instruction/", new_instruction, name="new_instruction"),
     path("upload-documents/", upload_documents, name="upload_documents"),
     path("my-settlements/", my_settlements, name="my_settlements"),
+    path("my-settlements/page/", my_settlements_page, name="my_settlements_page"),
+    path("my-settlements/search/", search_settlements, name="search_settlements"),
     path("dashboard/", solicitor_dashboard, name="solicitor_dashboard"),
     path("edit-instruction/<int:instruction_id>/", edit_instruction, name="edit_instruction"),
     path("delete-instruction/<int:instruction_id>/", delete_instruction, name="delete_instruction"),
     path("settlement/<int:settlement_id>/", view_settlement, name="view_settlement"),
+    path("documents/<int:document_id>/", download_document, name="download_document"),
+    path("documents/<int:document_id>/thumbnail/<str:sha256>.png", document_thumbnail, name="document_thumbnail"),
 
     # Chat
     path("long-poll-messages/", long_poll_messages, name="long_poll_messages"),
@@ -35,8 +40,10 @@ urlpatterns = [
     path("send-message/", send_message, name="send_message"),
     path("reply/<int:message_id>/", reply_view, name="reply_view"),
     path("mark-messages-read/", mark_messages_read, name="mark_messages_read"),
-    path("check-typing-status/", check_typing_status, name="check_typing_status"),
+    path("chat-typing/", chat_typing, name="chat_typing"),
     path("upload-file/", upload_chat_file, name="upload_chat_file"),
+    path("chat-files/<int:message_id>/", chat_file, name="chat_file"),
+    path("chat-files/uploads/<str:filename>", chat_upload, name="chat_upload"),
     path("delete-message/", delete_message, name="delete_message"),
 
     # Password reset
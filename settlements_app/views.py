@@ -1,5 +1,6 @@
 import os
 import json
+import math
 import time
 import base64
 import binascii
@@ -15,7 +16,7 @@ import pytz
 from django import forms
 from django.conf import settings
 from django.urls import reverse, reverse_lazy
-from django.http import JsonResponse, HttpResponse, HttpResponseRedirect
+from django.http import Http404, JsonResponse, HttpResponse, HttpResponseRedirect
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.csrf import csrf_protect, csrf_exempt
 from django.utils.decorators import method_decorator
@@ -25,19 +26,39 @@ from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib.auth.views import LoginView as DjangoLoginView, PasswordResetView
-from django.db import transaction
-from django.db.models import Q
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Prefetch, Q
 
 from django_otp import login as otp_login
 from django_otp.decorators import otp_required
 from django_otp.plugins.otp_totp.models import TOTPDevice
 
-from two_factor.utils import default_device
 from two_factor.forms import AuthenticationTokenForm, BackupTokenForm, DeviceValidationForm, TOTPDeviceForm
 from two_factor.views import LoginView as TwoFactorLoginView
 from two_factor.views.core import SetupView
 
-from .models import Instruction, Solicitor, Document, Firm, ChatMessage
+from .models import DOCUMENT_TYPE_CHOICES, Instruction, Solicitor, Document, Firm, ChatMessage
+from .chat import (
+    TYPING_TIMEOUT,
+    build_chat_delta,
+    chat_file_url,
+    mark_all_read,
+    mark_messages_read as mark_chat_messages_read,
+    parse_message_cursor,
+    parse_message_ids,
+    set_typing,
+    visible_messages,
+)
+from .decorators import login_required_json, streaming_upload
+from .devices import has_default_device
+from .documents import bulk_create_documents
+from .downloads import IMMUTABLE_CACHE_CONTROL, serve_protected_file
+from .mail import queue_mail
+from .notifier import get_notifier, park_slot
+from .pagination import keyset_page, parse_page_size
+from .search import search_instructions
+from .uploads import upload_too_large
 from .forms import (
     LoginForm,
     WelcomeStepForm,
@@ -82,9 +103,8 @@ class SettlexTwoFactorSetupView(SetupView):
             logger.debug("🚫 Superuser detected, skipping 2FA setup.")
             return redirect('admin:index')
 
-        # ✅ Skip setup if user already has confirmed TOTP device
-        existing = TOTPDevice.objects.filter(user=request.user, confirmed=True).first()
-        if existing:
+        # ✅ Skip setup if user already has a confirmed default device
+        if has_default_device(request.user):
             logger.debug("🔁 User already has confirmed device, redirecting to dashboard.")
             return redirect('settlements_app:my_settlements')
 
@@ -284,6 +304,18 @@ class CustomPasswordResetView(PasswordResetView):
     def get_current_app(self):
         return 'settlements_app'
 
+# ✅ Health Check for load balancers and uptime monitors
+def health_check(request):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+    except Exception as e:
+        logger.error(f"❌ Health check failed: {e}")
+        return JsonResponse({"status": "error", "database": "unavailable"}, status=503)
+    return JsonResponse({"status": "success", "database": connection.vendor})
+
+
 # Home View
 
 
@@ -293,7 +325,7 @@ def home(request):
                  user.username if user.is_authenticated else "Anonymous")
 
     if user.is_authenticated:
-        if not default_device(user):
+        if not has_default_device(user):
             logger.debug(
                 "✅ Authenticated but no 2FA device – redirecting to setup")
             return redirect('two_factor:setup')
@@ -434,30 +466,24 @@ def register(request):
             elif profession == "conveyancer":
                 admin_email_body += f"Conveyancer License: {conveyancer_license_number}\n"
 
-            # Send email to admin
-            send_mail(
+            # Queue email to admin (delivered by the send_queued_mail worker)
+            queue_mail(
                 subject="New Solicitor Registration Submitted",
                 message=admin_email_body,
-                from_email=settings.DEFAULT_FROM_EMAIL,
                 recipient_list=['info@onestoplegal.com.au'],
-                fail_silently=False,
             )
-            logger.info("✅ Email sent to admin successfully")
-            print("✅ Email sent to admin successfully")
+            logger.info("✅ Email to admin queued successfully")
 
-            # Send confirmation email to user
-            send_mail(
+            # Queue confirmation email to user
+            queue_mail(
                 subject="Registration Submitted - SettleX",
                 message=f"Dear {first_name} {last_name},\n\n"
                         f"Thank you for registering with SettleX. Your registration is currently pending approval.\n"
                         f"You will receive an email once your account has been activated.\n\n"
                         f"Regards,\nSettleX Team",
-                from_email=settings.DEFAULT_FROM_EMAIL,
                 recipient_list=[email],
-                fail_silently=False,
             )
-            logger.info("✅ Confirmation email sent to user successfully")
-            print("✅ Confirmation email sent to user successfully")
+            logger.info("✅ Confirmation email to user queued successfully")
 
             messages.success(
                 request, "Registration submitted! Please log in to continue.")
@@ -477,11 +503,17 @@ def register(request):
                   {'existing_firm': firm, 'page_title': 'Register an Account'})
 
 
+@streaming_upload("INSTRUCTION_UPLOAD_MAX_SIZE")
 def new_instruction(request):
     try:
         if request.method == 'POST':
             logger.info("✅ Received POST request for new instruction.")
 
+            if upload_too_large(request):
+                messages.error(
+                    request, "Document file is too large. Please upload a smaller file.")
+                return redirect('settlements_app:new_instruction')
+
             # Ensure file reference is provided
             file_reference = request.POST.get('file_reference', '').strip()
             if not file_reference:
@@ -562,12 +594,6 @@ def new_instruction(request):
                 document_name = request.POST.get('document_name', '').strip()
                 document_file = request.FILES['document_file']
 
-                if document_file.size > 10485760:  # 10 MB limit (optional)
-                    logger.error("❌ Document file size too large.")
-                    messages.error(
-                        request, "Document file is too large. Please upload a smaller file.")
-                    return redirect('settlements_app:new_instruction')
-
                 Document.objects.create(
                     instruction=instruction,
                     name=document_name,
@@ -590,8 +616,34 @@ def new_instruction(request):
         return redirect('settlements_app:my_settlements')
 
 
+# Columns rendered by the My Settlements listing
+SETTLEMENT_LIST_FIELDS = (
+    'id', 'firm_id', 'file_reference', 'purchaser_name',
+    'settlement_type', 'settlement_date', 'status',
+)
+
+
+def serialize_settlement(settlement):
+    """JSON row for the My Settlements listing and search results."""
+    return {
+        "id": settlement.id,
+        "file_reference": settlement.file_reference,
+        "purchaser_name": settlement.purchaser_name,
+        "settlement_type": settlement.get_settlement_type_display(),
+        "settlement_date": settlement.settlement_date.strftime("%d %b %Y") if settlement.settlement_date else "",
+        "status": settlement.status,
+        "status_display": settlement.get_status_display(),
+        "view_url": reverse('settlements_app:view_settlement', args=[settlement.id]),
+        "upload_url": f"{reverse('settlements_app:upload_documents')}?settlement_id={settlement.id}",
+    }
+
+
 @otp_required
 def my_settlements(request):
+    settlements = []
+    next_cursor = None
+    page_size = parse_page_size(request.GET.get('page_size'))
+
     try:
         # Safely get the user's Solicitor object
         solicitor = getattr(request.user, 'solicitor', None)
@@ -599,7 +651,6 @@ def my_settlements(request):
             "👤 Solicitor for user %s: %s",
             request.user.username,
             solicitor)
-        print(f"👤 Solicitor for user {request.user.username}: {solicitor}")
 
         # Check for Solicitor and Firm
         if not solicitor:
@@ -609,51 +660,77 @@ def my_settlements(request):
             logger.warning(
                 "⚠️ No solicitor found for user: %s",
                 request.user.username)
-            print(f"⚠️ No solicitor found for user: {request.user.username}")
-            settlements = []
-        elif not solicitor.firm:
+        elif not solicitor.firm_id:
             messages.warning(
                 request,
                 "Your solicitor profile is not associated with a firm. Please update your profile.")
             logger.warning("⚠️ No firm found for solicitor: %s", solicitor)
-            print(f"⚠️ No firm found for solicitor: {solicitor}")
-            settlements = []
         else:
-            # Get settlements associated with the solicitor's firm
-            settlements = Instruction.objects.filter(
-                solicitor__firm=solicitor.firm).order_by('-settlement_date')
+            # One keyset page of the firm's settlements; further pages come from my_settlements_page
+            settlements, next_cursor = keyset_page(
+                Instruction.objects.filter(firm_id=solicitor.firm_id).only(*SETTLEMENT_LIST_FIELDS),
+                request.GET.get('cursor'),
+                page_size)
             logger.debug(
-                "📋 Found %d settlements for firm: %s",
-                settlements.count(),
-                solicitor.firm)
-            print(
-                f"📋 Found {settlements.count()} settlements for firm: {solicitor.firm}")
-
-        # Fetch chat messages for the logged-in user
-        chat_messages = ChatMessage.objects.filter(
-            recipient=request.user).order_by("timestamp")
-        logger.debug(
-            "💬 Found %d chat messages for user: %s",
-            chat_messages.count(),
-            request.user.username)
-        print(
-            f"💬 Found {chat_messages.count()} chat messages for user: {request.user.username}")
+                "📋 Loaded %d settlements for firm ID: %s",
+                len(settlements),
+                solicitor.firm_id)
 
     except Exception as e:
         logger.error("🚨 Error loading settlements: %s", str(e))
-        print(f"🚨 Error loading settlements: {str(e)}")
         messages.error(
             request,
             "An error occurred while loading your settlements.")
         settlements = []
-        chat_messages = []
+        next_cursor = None
 
     return render(request, 'settlements_app/my_settlements.html', {
         'settlements': settlements,
-        'chat_messages': chat_messages,
+        'next_cursor': next_cursor,
+        'page_size': page_size,
+    })
+
+
+@otp_required
+def my_settlements_page(request):
+    """Return one keyset page of the firm's settlements as JSON for the My Settlements listing."""
+    solicitor = getattr(request.user, 'solicitor', None)
+    if not solicitor or not solicitor.firm_id:
+        return JsonResponse(
+            {"status": "error", "message": "You must be a registered solicitor with a firm."}, status=403)
+
+    settlements, next_cursor = keyset_page(
+        Instruction.objects.filter(firm_id=solicitor.firm_id).only(*SETTLEMENT_LIST_FIELDS),
+        request.GET.get('cursor'),
+        parse_page_size(request.GET.get('page_size')))
+
+    return JsonResponse({
+        "status": "success",
+        "settlements": [serialize_settlement(settlement) for settlement in settlements],
+        "next_cursor": next_cursor,
+    })
+
+
+@otp_required
+def search_settlements(request):
+    """Full-text search over the firm's settlements (parties, address, title references, documents)."""
+    solicitor = getattr(request.user, 'solicitor', None)
+    if not solicitor or not solicitor.firm_id:
+        return JsonResponse(
+            {"status": "error", "message": "You must be a registered solicitor with a firm."}, status=403)
+
+    query = request.GET.get('q', '').strip()
+    results = search_instructions(solicitor.firm_id, query, limit=parse_page_size(request.GET.get('limit')))
+    logger.debug("🔎 Search '%s' for firm ID %s returned %d results", query, solicitor.firm_id, len(results))
+
+    return JsonResponse({
+        "status": "success",
+        "query": query,
+        "settlements": [serialize_settlement(settlement) for settlement in results],
     })
 
 
+@streaming_upload("DOCUMENT_UPLOAD_MAX_SIZE")
 def upload_documents(request):
     """Allows solicitors to upload documents for any instruction within their firm."""
     solicitor = getattr(request.user, 'solicitor', None)
@@ -666,7 +743,7 @@ def upload_documents(request):
 
     try:
         instructions = Instruction.objects.filter(
-            solicitor__firm=solicitor.firm).order_by('-settlement_date')
+            firm=solicitor.firm).order_by('-settlement_date')
 
         preselected_instruction = None
         settlement_id = request.GET.get('settlement_id') or request.POST.get('instruction_id')
@@ -676,7 +753,7 @@ def upload_documents(request):
                 preselected_instruction = get_object_or_404(
                     Instruction,
                     id=settlement_id,
-                    solicitor__firm=solicitor.firm
+                    firm=solicitor.firm
                 )
             except Exception as e:
                 logger.error(f"❌ Error finding settlement instruction: {e}")
@@ -684,28 +761,47 @@ def upload_documents(request):
                 # ✅ Namespaced
                 return redirect('settlements_app:upload_documents')
 
-        if request.method == 'POST' and request.FILES.get('document'):
+        if request.method == 'POST' and upload_too_large(request):
+            max_mb = settings.DOCUMENT_UPLOAD_MAX_SIZE // (1024 * 1024)
+            messages.error(request, f"File is too large. The maximum upload size is {max_mb} MB.")
+            return redirect('settlements_app:upload_documents')
+
+        # Several files per request (``documents``), each with its own name and type;
+        # the single ``document`` field is still accepted
+        uploads = request.FILES.getlist('documents') or request.FILES.getlist('document')
+        if request.method == 'POST' and uploads:
             if not preselected_instruction:
                 messages.error(
                     request, "No valid instruction selected for document upload.")
                 # ✅ Namespaced
                 return redirect('settlements_app:upload_documents')
 
-            uploaded_file = request.FILES['document']
-            document_type = request.POST.get(
-                'document_type', 'contract').strip()
-            document_name = request.POST.get(
-                'document_name', uploaded_file.name).strip()
-
-            Document.objects.create(
-                instruction=preselected_instruction,
-                name=document_name,
-                file=uploaded_file,
-                document_type=document_type
-            )
+            names = request.POST.getlist('document_names') or request.POST.getlist('document_name')
+            types = request.POST.getlist('document_types') or request.POST.getlist('document_type')
+            valid_types = dict(DOCUMENT_TYPE_CHOICES)
+
+            documents = []
+            for index, uploaded_file in enumerate(uploads):
+                document_name = (names[index] if index < len(names) else '').strip() or uploaded_file.name
+                document_type = (types[index] if index < len(types) else '').strip() or 'contract'
+                if document_type not in valid_types:
+                    messages.error(request, f"Invalid document type for '{uploaded_file.name}'.")
+                    return redirect('settlements_app:upload_documents')
+                documents.append(Document(
+                    instruction=preselected_instruction,
+                    name=document_name,
+                    file=uploaded_file,
+                    document_type=document_type
+                ))
 
-            messages.success(
-                request, f"File '{document_name}' uploaded successfully!")
+            bulk_create_documents(documents)
+
+            if len(documents) == 1:
+                messages.success(
+                    request, f"File '{documents[0].name}' uploaded successfully!")
+            else:
+                messages.success(
+                    request, f"{len(documents)} documents uploaded successfully!")
             return redirect(
                 'settlements_app:view_settlement',
                 settlement_id=preselected_instruction.id)  # ✅ Namespaced
@@ -719,6 +815,7 @@ def upload_documents(request):
     return render(request, 'settlements_app/upload_documents.html', {
         'instructions': instructions,
         'preselected_instruction': preselected_instruction,
+        'document_types': DOCUMENT_TYPE_CHOICES,
         'page_title': 'Upload Documents'
     })
 
@@ -799,9 +896,21 @@ def delete_instruction(request, id):
 # ✅ View Settlement Details
 
 
+def firm_solicitor(user):
+    """
+    The user's solicitor profile with its firm, in one query. The result is
+    cached on the user, so templates reading ``user.solicitor.firm`` reuse it.
+    """
+    solicitor = Solicitor.objects.select_related('firm').filter(user=user).first()
+    if solicitor is not None:
+        user.solicitor = solicitor
+    return solicitor
+
+
+@login_required
 def view_settlement(request, settlement_id):
     """View settlement details and related documents for the user's firm."""
-    solicitor = getattr(request.user, 'solicitor', None)
+    solicitor = firm_solicitor(request.user)
 
     if not solicitor or not solicitor.firm:
         messages.error(
@@ -811,14 +920,17 @@ def view_settlement(request, settlement_id):
 
     try:
         # ✅ Ensure solicitors from the same firm can see each other's settlements
+        # The instruction, its solicitor/firm and documents (with their blobs) load in two queries
         settlement = get_object_or_404(
-            Instruction,
+            Instruction.objects.select_related('solicitor__user', 'firm').prefetch_related(
+                Prefetch('documents', queryset=Document.objects.select_related('blob').order_by('uploaded_at', 'pk'))
+            ),
             id=settlement_id,
-            solicitor__firm=solicitor.firm  # Ensures access is firm-wide
+            firm=solicitor.firm  # Ensures access is firm-wide
         )
 
-        # ✅ Fetch all documents linked to this settlement
-        documents = Document.objects.filter(instruction=settlement)
+        # ✅ Documents linked to this settlement (already prefetched)
+        documents = settlement.documents.all()
 
     except Exception as e:
         logger.error(f"❌ Error loading settlement details: {e}")
@@ -837,6 +949,85 @@ def view_settlement(request, settlement_id):
     return render(request, 'settlements_app/view_settlements.html', context)
 
 
+def firm_documents(request):
+    """Documents the user may open: their firm's (all documents for staff)."""
+    if request.user.is_staff:
+        return Document.objects.all()
+    return Document.objects.filter(instruction__firm__solicitors__user=request.user)
+
+
+# ✅ Protected Document Download (firm-scoped; bytes are sent by the web server when configured)
+@login_required
+def download_document(request, document_id):
+    document = firm_documents(request).filter(pk=document_id).only("name", "file", "sha256").first()
+    if document is None or not document.file:
+        logger.warning(f"🚫 Document {document_id} not available to user {request.user}")
+        raise Http404("Document not found")
+
+    # Name the download after the document, keeping the stored file's extension
+    filename = document.name or os.path.basename(document.file.name)
+    if not os.path.splitext(filename)[1]:
+        filename += os.path.splitext(document.file.name)[1]
+
+    return serve_protected_file(
+        request,
+        document.file.name,
+        filename,
+        etag=f'"{document.sha256}"' if document.sha256 else None,
+        as_attachment=request.GET.get("download") == "1",
+    )
+
+
+# ✅ Document Thumbnail (generated in the background; immutable, so cached long-term)
+@login_required
+def document_thumbnail(request, document_id, sha256):
+    document = (
+        firm_documents(request).filter(pk=document_id)
+        .select_related("blob").only("blob__sha256", "blob__thumbnail").first()
+    )
+    blob = document.blob if document else None
+    if blob is None or blob.sha256 != sha256 or not blob.thumbnail:
+        raise Http404("Preview not available")
+
+    return serve_protected_file(
+        request,
+        blob.thumbnail.name,
+        f"{sha256}.png",
+        etag=f'"{sha256}-thumb"',
+        cache_control=IMMUTABLE_CACHE_CONTROL,
+    )
+
+
+# ✅ Chat Attachment (conversation participants and staff only)
+@login_required
+def chat_file(request, message_id):
+    message = visible_messages(request.user).filter(pk=message_id).only("file").first()
+    if message is None or not message.file:
+        logger.warning(f"🚫 Chat file {message_id} not available to user {request.user}")
+        raise Http404("File not found")
+
+    return serve_protected_file(
+        request,
+        message.file.name,
+        os.path.basename(message.file.name),
+        as_attachment=request.GET.get("download") == "1",
+    )
+
+
+def chat_upload_name(user, filename):
+    """Storage name of a file the user uploaded outside a message; only they can fetch it back."""
+    return f"chat_files/uploads/{user.id}/{filename}"
+
+
+# ✅ Standalone Chat Upload (served back to the uploader only)
+@login_required
+def chat_upload(request, filename):
+    name = chat_upload_name(request.user, filename)
+    if filename in (".", "..") or not default_storage.exists(name):
+        raise Http404("File not found")
+    return serve_protected_file(request, name, filename)
+
+
 # ✅ Set up logger
 logger = logging.getLogger(__name__)
 
@@ -850,60 +1041,55 @@ def get_brisbane_time():
     return now().astimezone(BRISBANE_TZ)
 
 
+@login_required_json
 def long_poll_messages(request):
-    """Fetch full chat history (both sent & received messages) for the logged-in user."""
+    """
+    Return the chat messages and read-state changes since the client's cursor.
+
+    When nothing has changed (including the read watermark and typing flag the
+    client passes as ``read_up_to`` and ``is_typing``) the request is held until
+    a wakeup is published for the user or ``timeout`` (capped at
+    ``CHAT_LONG_POLL_TIMEOUT``, and at ``TYPING_TIMEOUT`` while the client
+    shows staff typing) expires. When the process already holds
+    ``CHAT_LONG_POLL_MAX_PARKED`` parked polls, the answer is immediate and
+    carries ``retry_after`` (seconds) for the client's next poll.
+    """
     user = request.user
-    logger.info(
-        f"📩 Long poll request from user: {user} (ID: {user.id}) at {now()} - Poll cycle start")
+    last_message_id = parse_message_cursor(request.GET.get("last_message_id"))
+    shown_read_up_to = parse_message_cursor(request.GET.get("read_up_to"))  # Read watermark the client shows
+    shown_typing = request.GET.get("is_typing", "false").lower() == "true"  # Typing state the client shows
+    logger.debug(
+        f"📩 Chat sync for user: {user} (ID: {user.id}) - last_message_id={last_message_id}, read_up_to={shown_read_up_to}")
 
     try:
-        logger.debug("Fetching messages...")
-        messages = ChatMessage.objects.filter(
-            Q(sender=user) | Q(recipient=user))
-        messages = messages.filter(
-            timestamp__gte=now() -
-            timedelta(
-                days=7)).order_by("timestamp")
-
-        total_messages = messages.count()
-        logger.info(f"📬 Total messages fetched for {user}: {total_messages}")
-
-        if total_messages == 0:
-            logger.info("No messages found, returning empty response.")
-            return JsonResponse(
-                {"messages": [], "status": "success"}, status=200)
+        timeout = float(request.GET.get("timeout", settings.CHAT_LONG_POLL_TIMEOUT))
+    except ValueError:
+        timeout = settings.CHAT_LONG_POLL_TIMEOUT
+    if not math.isfinite(timeout):
+        timeout = settings.CHAT_LONG_POLL_TIMEOUT  # nan/inf would slip through min/max
+    timeout = min(max(timeout, 0), settings.CHAT_LONG_POLL_TIMEOUT)
+    if shown_typing:
+        timeout = min(timeout, TYPING_TIMEOUT)  # An expiring typing flag publishes no wakeup
 
-        messages_data = []
-        for msg in messages:
-            try:
-                timestamp_str = localtime(
-                    msg.timestamp, BRISBANE_TZ).strftime("%d %b %Y, %I:%M %p")
-                is_read_value = msg.is_read
-                role = "sender" if msg.sender == user else "recipient" if msg.recipient == user else "other"
-                logger.debug(
-                    f"Poll at {now()}: Message {msg.id} - is_read={is_read_value}, timestamp={timestamp_str}, sender={msg.sender.username}, recipient={msg.recipient.username}, user_role={role}")
-                message_dict = {
-                    "id": msg.id,
-                    "sender_name": msg.sender.get_full_name() or msg.sender.username,
-                    "sender_username": msg.sender.username,  # New field for direct comparison
-                    "recipient_name": msg.recipient.get_full_name() or msg.recipient.username,
-                    "message": msg.message,
-                    "timestamp": timestamp_str,
-                    "is_read": is_read_value,
-                    "user_role": role,
-                    "file_url": msg.file.url if msg.file else None  # Include file URL if exists
-                }
-                messages_data.append(message_dict)
-            except Exception as e:
-                logger.error(
-                    f"Error processing message {msg.id}: {str(e)}",
-                    exc_info=True)
-                continue
-
-        logger.info(
-            f"Poll cycle completed at {now()} - Returning successful response with {len(messages_data)} messages.")
-        return JsonResponse(
-            {"messages": messages_data, "status": "success"}, status=200)
+    try:
+        with get_notifier().listen(user.id) as listener:
+            payload = build_chat_delta(user, last_message_id)
+            changed = (payload["messages"] or payload["read_up_to"] != shown_read_up_to
+                       or payload["is_typing"] != shown_typing)
+            if not changed and timeout:
+                with park_slot() as parked:
+                    if parked:
+                        # Park until a wakeup is published, releasing the DB connection meanwhile.
+                        if not connection.in_atomic_block:
+                            connection.close()
+                        if listener.wait(timeout):
+                            payload = build_chat_delta(user, last_message_id)
+                    else:
+                        # Every parking slot is taken: answer now and have the client back off
+                        payload["retry_after"] = settings.CHAT_LONG_POLL_BUSY_RETRY
+        logger.debug(
+            f"📬 Returning {len(payload['messages'])} new messages (read up to {payload['read_up_to']}) to {user}")
+        return JsonResponse(payload, status=200)
 
     except Exception as e:
         error_details = traceback.format_exc()
@@ -915,10 +1101,14 @@ def long_poll_messages(request):
                             status=500)
 
 
+@streaming_upload("CHAT_UPLOAD_MAX_SIZE")
 def send_message(request):
     logger.info(
         f"User authenticated: {request.user.is_authenticated}, User: {request.user}")
     if request.method == "POST":
+        if upload_too_large(request):
+            return JsonResponse(
+                {"status": "error", "message": "File is too large"}, status=413)
         try:
             logger.info(
                 f"Received POST request from user {request.user.username}: POST={request.POST}, FILES={request.FILES}")
@@ -950,24 +1140,22 @@ def send_message(request):
                 recipient=recipient,
                 message=message_text if message_text else None,
                 file=file,
-                is_read=False
             )
             message.save()
-            logger.info(
-                f"Message saved successfully: ID={message.id}, initial_is_read={message.is_read}")
+            logger.info(f"Message saved successfully: ID={message.id}")
 
             response_data = {
                 "status": "success",
                 "message": "Message sent",
                 "id": message.id,
-                "is_read": message.is_read,
+                "is_read": False,
                 "sender_name": request.user.get_full_name() or request.user.username,
                 "sender_username": request.user.username,
                 "recipient_name": recipient.get_full_name() or recipient.username,
                 "timestamp": localtime(
                     message.timestamp,
                     BRISBANE_TZ).strftime("%d %b %Y, %I:%M %p"),
-                "file_url": message.file.url if message.file else None}
+                "file_url": chat_file_url(message.id) if message.file else None}
             logger.debug(f"Message response: {response_data}")
             return JsonResponse(response_data)
         except Exception as e:
@@ -987,24 +1175,12 @@ def check_new_messages(request):
         f"🔍 Checking new messages for user: {user} (ID: {user.id}) at {now()}")
 
     try:
-        # Fetch unread messages where the user is the recipient
-        unread_messages = ChatMessage.objects.filter(
-            recipient=user, is_read=False).exclude(
-            sender=user)
-        total_unread = unread_messages.count()
+        # Counts the unread messages and moves the read watermark past them (one row per conversation)
+        total_unread = mark_all_read(user)
         logger.info(f"📬 Found {total_unread} unread messages for {user}")
 
-        if total_unread == 0:
-            logger.info("No new messages found.")
-            return JsonResponse(
-                {"status": "success", "new_messages": 0}, status=200)
-
-        # Optionally mark messages as read (if intended by original design)
-        updated_count = unread_messages.update(is_read=True)
-        logger.info(f"✅ Marked {updated_count} messages as read for {user}")
-
         return JsonResponse(
-            {"status": "success", "new_messages": updated_count}, status=200)
+            {"status": "success", "new_messages": total_unread}, status=200)
 
     except Exception as e:
         logger.error(
@@ -1036,8 +1212,8 @@ def reply_view(request, message_id):
                 recipient=recipient,  # Ensure this is the actual user
                 message=reply_text,
                 timestamp=now(),
-                is_read=False
             )
+            set_typing(request.user, False, recipient.id)
 
             messages.success(request, "Reply sent successfully!")
             return HttpResponseRedirect(
@@ -1058,23 +1234,18 @@ def mark_messages_read(request):
 
     try:
         data = json.loads(request.body)  # Read JSON data properly
-        message_ids = data.get("message_ids", [])
+        # Valid ids only (the same parsing as the WebSocket "read" frames)
+        message_ids = parse_message_ids(data.get("message_ids")) if isinstance(data, dict) else []
 
         if not message_ids:
             return JsonResponse(
                 {"status": "error", "message": "No message IDs provided"}, status=400)
 
-        # Convert IDs to integers (skip invalid ones)
-        message_ids = [int(msg_id)
-                       for msg_id in message_ids if str(msg_id).isdigit()]
-
         # Update messages if user is authenticated
-        messages = ChatMessage.objects.filter(
-            id__in=message_ids, recipient=request.user, is_read=False)
-        messages.update(is_read=True)  # Efficient bulk update
+        updated = mark_chat_messages_read(request.user, message_ids)
 
         return JsonResponse(
-            {"status": "success", "updated": len(messages)}, status=200)
+            {"status": "success", "updated": updated}, status=200)
 
     except json.JSONDecodeError:
         return JsonResponse(
@@ -1086,17 +1257,35 @@ def mark_messages_read(request):
                             status=500)
 
 
-def check_typing_status(request):
-    is_typing = request.GET.get('admin_typing', 'false').lower() == 'true'
-    return JsonResponse({"is_typing": is_typing})
+@login_required_json
+def chat_typing(request):
+    """
+    Record that a staff member started (``is_typing=true``) or stopped typing
+    into the conversation of ``user_id``. The user sees the flag in their next
+    chat sync. Users' own typing is not shared.
+    """
+    if request.method != "POST":
+        return JsonResponse(
+            {"status": "error", "message": "Invalid request method"}, status=400)
+    if not request.user.is_staff:
+        return JsonResponse(
+            {"status": "error", "message": "Only staff typing is shared"}, status=403)
 
+    is_typing = request.POST.get("is_typing", "false").lower() == "true"
+    set_typing(request.user, is_typing, parse_message_cursor(request.POST.get("user_id")))
+    return JsonResponse({"status": "success"})
 
+
+@login_required_json
+@streaming_upload("CHAT_UPLOAD_MAX_SIZE")
 def upload_chat_file(request):
+    if request.method == "POST" and upload_too_large(request):
+        return JsonResponse(
+            {"status": "error", "message": "File is too large"}, status=413)
     if request.method == "POST" and request.FILES.get("file"):
         file = request.FILES["file"]
-        from django.core.files.storage import default_storage
-        file_name = default_storage.save(f"chat_files/{file.name}", file)
-        file_url = default_storage.url(file_name)
+        file_name = default_storage.save(chat_upload_name(request.user, file.name), file)
+        file_url = reverse("settlements_app:chat_upload", args=[os.path.basename(file_name)])
         return JsonResponse({"status": "success", "file_url": file_url})
     return JsonResponse(
         {"status": "error", "message": "No file uploaded"}, status=400)
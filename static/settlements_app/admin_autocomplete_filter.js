@@ -0,0 +1,15 @@
+'use strict';
+{
+    // Reload the changelist filtered on the value picked in an AutocompleteFilter
+    const $ = django.jQuery;
+    $(function() {
+        $('[data-autocomplete-filter] select').on('change', function() {
+            const item = this.closest('[data-autocomplete-filter]');
+            const params = new URLSearchParams(item.dataset.queryString);
+            if (this.value) {
+                params.set(item.dataset.autocompleteFilter, this.value);
+            }
+            window.location.search = params.toString();
+        });
+    });
+}